@@ -0,0 +1,575 @@
+#!/usr/bin/env python3
+"""
+bench_wayback.py — Offline benchmark for harvest_wayback.py.
+
+Starts a local stand-in for the Wayback Machine (the CDX API and the id_
+content endpoint) serving a synthetic or recorded site, points a
+WaybackHarvester at it and reports, per harvest phase, wall time, request
+counts, throughput and peak memory.  Nothing touches web.archive.org.
+
+Synthetic site:
+  N Drupal-like pages, each linking to a few other pages, one of a set of
+  stylesheets and a few images.  Stylesheets reference background images
+  that are captured but absent from the domain CDX listing (so they are
+  found by asset discovery), and a fraction of image references have no
+  capture at all (404, as for most assets in the real usgin.org harvest).
+
+Usage:
+  python bench_wayback.py                          # 250 pages, no latency
+  python bench_wayback.py --pages 10000 --latency 0.05 --error-rate 0.02
+  python bench_wayback.py --workers 8 --adaptive   # any harvester options
+  python bench_wayback.py --recorded .             # serve this archive
+  python bench_wayback.py --json bench.json        # machine-readable report
+"""
+
+import argparse
+import base64
+import contextlib
+import hashlib
+import io
+import json
+import logging
+import mimetypes
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+import harvest_wayback
+from harvest_wayback import WaybackHarvester
+
+# Harvester methods timed as phases, in pipeline order
+PHASES = [
+    ("cdx", "deduplicate_urls"),  # drains the query_cdx() generator
+    ("download", "download_all_cdx"),
+    ("assets", "discover_and_download_assets"),
+    ("rewrite", "rewrite_all_links"),
+]
+
+CAPTURE_TIMESTAMP = "20250101000000"
+OLDER_TIMESTAMP = "20180101000000"
+
+logger = logging.getLogger("bench")
+
+# ---------------------------------------------------------------------------
+# Sites
+# ---------------------------------------------------------------------------
+
+
+def cdx_key(url: str) -> str:
+    """Match key for CDX lookups: host without www., path without slash."""
+    parsed = urlparse(url if "://" in url else f"http://{url}")
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return f"{host}{parsed.path.rstrip('/') or '/'}"
+
+
+class SyntheticSite:
+    """Deterministic Drupal-like site generated on demand.
+
+    Bodies are built from the URL alone, so a 100k-page site costs no
+    memory until a page is requested.
+    """
+
+    def __init__(
+        self, domain: str, pages: int, stylesheets: int = 20,
+        images: int = 200, links_per_page: int = 8, html_size: int = 8000,
+        asset_size: int = 4000, missing_ratio: float = 0.1,
+    ):
+        self.domain = domain
+        self.pages = pages
+        self.stylesheets = max(1, stylesheets)
+        self.images = max(1, images)
+        self.links_per_page = links_per_page
+        self.html_size = html_size
+        self.asset_size = asset_size
+        self.missing = int(self.images * missing_ratio)
+
+    # URL layout -----------------------------------------------------------
+
+    def page_url(self, i: int) -> str:
+        return f"http://{self.domain}/" if i == 0 else f"http://{self.domain}/node/{i}"
+
+    def css_url(self, j: int) -> str:
+        return f"http://{self.domain}/sites/all/themes/bench/css/style{j}.css"
+
+    def image_url(self, j: int) -> str:
+        return f"http://{self.domain}/sites/default/files/images/img{j}.png"
+
+    def background_url(self, j: int) -> str:
+        return f"http://{self.domain}/sites/all/themes/bench/images/bg{j}.png"
+
+    def listed_urls(self):
+        """URLs in the domain CDX listing (pages, CSS, captured images)."""
+        for i in range(self.pages):
+            yield self.page_url(i)
+        for j in range(self.stylesheets):
+            yield self.css_url(j)
+        for j in range(self.missing, self.images):
+            yield self.image_url(j)
+
+    def captured_urls(self):
+        """Every URL with a capture: the listing plus CSS backgrounds."""
+        yield from self.listed_urls()
+        for j in range(self.stylesheets):
+            yield self.background_url(j)
+
+    # Content --------------------------------------------------------------
+
+    def body(self, url: str):
+        """(mimetype, bytes) for a captured URL, or None."""
+        path = urlparse(url).path
+        name = path.rsplit("/", 1)[-1]
+        try:
+            if path in ("", "/"):
+                return "text/html", self._page(0)
+            if path.startswith("/node/"):
+                i = int(name)
+                if 0 < i < self.pages:
+                    return "text/html", self._page(i)
+            elif name.startswith("style") and name.endswith(".css"):
+                j = int(name[5:-4])
+                if j < self.stylesheets:
+                    return "text/css", self._css(j)
+            elif name.startswith("img") and name.endswith(".png"):
+                j = int(name[3:-4])
+                if self.missing <= j < self.images:
+                    return "image/png", self._blob(url, self.asset_size)
+            elif name.startswith("bg") and name.endswith(".png"):
+                j = int(name[2:-4])
+                if j < self.stylesheets:
+                    return "image/png", self._blob(url, self.asset_size)
+        except ValueError:
+            pass
+        return None
+
+    def _page(self, i: int) -> bytes:
+        rng = random.Random(i)
+        links = "".join(
+            f'<li><a href="/node/{rng.randrange(1, max(2, self.pages))}">'
+            f"Node</a></li>"
+            for _ in range(self.links_per_page)
+        )
+        imgs = "".join(
+            f'<img src="/sites/default/files/images/img{rng.randrange(self.images)}.png">'
+            for _ in range(3)
+        )
+        css = f"/sites/all/themes/bench/css/style{i % self.stylesheets}.css"
+        head = (
+            f'<!DOCTYPE html><html><head><meta charset="utf-8">'
+            f'<title>Node {i}</title><link rel="stylesheet" href="{css}">'
+            f"</head><body><ul>{links}</ul>{imgs}<p>"
+        ).encode()
+        tail = b"</p></body></html>"
+        filler = max(0, self.html_size - len(head) - len(tail))
+        return head + (b"lorem ipsum " * (filler // 12 + 1))[:filler] + tail
+
+    def _css(self, j: int) -> bytes:
+        return (
+            f"body {{ background: url(../images/bg{j}.png) }}\n"
+            f".logo {{ background: url('/sites/default/files/images/img{j % self.images}.png') }}\n"
+        ).encode()
+
+    @staticmethod
+    def _blob(url: str, size: int) -> bytes:
+        seed = hashlib.sha1(url.encode()).digest()
+        return (seed * (size // len(seed) + 1))[:size]
+
+
+class RecordedSite:
+    """Serves an existing local mirror (files listed in its manifest.json)."""
+
+    def __init__(self, root: Path, domain: str):
+        self.domain = domain
+        self.root = root
+        manifest = json.loads((root / "manifest.json").read_text(encoding="utf-8"))
+        self.files: dict[str, Path] = {}
+        self.urls: dict[str, str] = {}
+        for rel in manifest.get("files", []):
+            if not (root / rel).is_file():
+                continue
+            path = "/" + rel
+            if path.endswith("/index.html"):
+                # Rewritten mirrors link to the index file itself
+                self.files[cdx_key(f"http://{domain}{path}")] = root / rel
+                path = path[: -len("index.html")]
+            key = cdx_key(f"http://{domain}{path}")
+            self.files[key] = root / rel
+            self.urls[key] = f"http://{key}"
+
+    def listed_urls(self):
+        yield from self.urls.values()
+
+    captured_urls = listed_urls
+
+    def body(self, url: str):
+        path = self.files.get(cdx_key(url))
+        if path is None:
+            return None
+        mimetype = "text/html" if path.suffix in (".html", ".htm") else (
+            mimetypes.guess_type(path.name)[0]
+            or "application/octet-stream"
+        )
+        return mimetype, path.read_bytes()
+
+
+# ---------------------------------------------------------------------------
+# Wayback stand-in server
+# ---------------------------------------------------------------------------
+
+
+class StandIn:
+    """Local HTTP server imitating the CDX API and id_ endpoint."""
+
+    def __init__(self, site, latency: float = 0.0, error_rate: float = 0.0,
+                 seed: int = 0, page_size: int = 0):
+        self.site = site
+        self.latency = latency
+        self.error_rate = error_rate
+        # Rows per CDX result page; 0 answers as a server without pagination
+        self.page_size = page_size
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts: dict[str, int] = {}
+        self.bytes_sent = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key: str, nbytes: int = 0) -> None:
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+            self.bytes_sent += nbytes
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.counts, bytes=self.bytes_sent)
+
+    def should_fail(self) -> bool:
+        with self.lock:
+            return self.rng.random() < self.error_rate
+
+    # CDX ------------------------------------------------------------------
+
+    def cdx_rows(self, query: dict) -> list:
+        fields = query.get("fl", [harvest_wayback.CDX_FIELDS])[0].split(",")
+        url = unquote(query["url"][0])
+        prefix = url.endswith("*") or query.get("matchType", [""])[0] == "prefix"
+        key = cdx_key(url.rstrip("*"))
+        if prefix and url.rstrip("*").endswith("/"):
+            key = key.rstrip("/") + "/"
+        paged = "page" in query or "showNumPages" in query
+        limit = 1 << 62 if paged else int(query.get("limit", ["100000"])[0])
+        source = self.site.listed_urls() if url.endswith("/*") else self.site.captured_urls()
+        rows = []
+        for original in source:
+            candidate = cdx_key(original)
+            if prefix:
+                if not (candidate + "/").startswith(key) and not candidate.startswith(key):
+                    continue
+            elif candidate != key:
+                continue
+            rows.extend(self.captures(original))
+            if len(rows) >= limit:
+                break
+        if "closest" in query:
+            target = int(query["closest"][0])
+            rows.sort(key=lambda r: abs(int(r["timestamp"]) - target))
+        rows = rows[:limit]
+        if "page" in query:
+            page = int(query["page"][0])
+            rows = rows[page * self.page_size:(page + 1) * self.page_size]
+        if not rows:
+            return []
+        return [fields] + [[r[f] for f in fields] for r in rows]
+
+    def cdx_num_pages(self, query: dict) -> Optional[int]:
+        if not self.page_size:
+            return None
+        rows = max(len(self.cdx_rows(query)) - 1, 0)
+        return max(1, -(-rows // self.page_size))
+
+    def captures(self, original: str) -> list[dict]:
+        found = self.site.body(original)
+        if found is None:
+            return []
+        mimetype, body = found
+        digest = base64.b32encode(hashlib.sha1(body).digest()).decode()
+        parsed = urlparse(original)
+        urlkey = ",".join(reversed(parsed.hostname.split("."))) + ")" + parsed.path
+        record = {
+            "urlkey": urlkey, "timestamp": CAPTURE_TIMESTAMP,
+            "original": original, "mimetype": mimetype, "statuscode": "200",
+            "digest": digest, "length": str(len(body)),
+        }
+        rows = [record]
+        # Some URLs have an older capture too, to exercise deduplication
+        if int(hashlib.md5(original.encode()).hexdigest(), 16) % 4 == 0:
+            rows.insert(0, dict(record, timestamp=OLDER_TIMESTAMP))
+        return rows
+
+    # HTTP -----------------------------------------------------------------
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body=b"", ctype="text/plain", headers=()):
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if standin.latency:
+                    time.sleep(standin.latency)
+                parsed = urlparse(self.path)
+                kind = "cdx" if parsed.path.startswith("/cdx/") else "web"
+                if standin.should_fail():
+                    standin.count(f"{kind}_503")
+                    self.reply(503, headers=[("Retry-After", "0")])
+                    return
+                if kind == "cdx" and "showNumPages" in parsed.query:
+                    pages = standin.cdx_num_pages(parse_qs(parsed.query))
+                    if pages is None:
+                        self.reply(400)
+                        return
+                    body = f"{pages}\n".encode()
+                    standin.count("cdx", len(body))
+                    self.reply(200, body, "text/plain")
+                    return
+                if kind == "cdx":
+                    rows = standin.cdx_rows(parse_qs(parsed.query))
+                    # One row per line, as the real CDX server writes it
+                    body = ("[" + ",\n".join(map(json.dumps, rows)) + "]\n").encode()
+                    standin.count("cdx", len(body))
+                    self.reply(200, body, "application/json")
+                    return
+                original = self.path.split("id_/", 1)[-1]
+                found = standin.site.body(original)
+                if found is None:
+                    standin.count("web_404")
+                    self.reply(404)
+                    return
+                mimetype, body = found
+                standin.count("web", len(body))
+                self.reply(200, body, mimetype)
+
+        return Handler
+
+
+# ---------------------------------------------------------------------------
+# Benchmark
+# ---------------------------------------------------------------------------
+
+
+def instrument(harvester: WaybackHarvester, standin: StandIn,
+               trace_memory: bool) -> list[dict]:
+    """Wrap each phase method to record time, requests and memory."""
+    results: list[dict] = []
+
+    def wrap(phase: str, name: str, method):
+        def timed(*args, **kwargs):
+            # Time the first call only: deduplicate_urls() is also used
+            # for asset captures later on
+            setattr(harvester, name, method)
+            before = standin.snapshot()
+            if trace_memory:
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                after = standin.snapshot()
+                requests_made = {
+                    k: after.get(k, 0) - before.get(k, 0)
+                    for k in after if k != "bytes" and after.get(k, 0) != before.get(k, 0)
+                }
+                results.append({
+                    "phase": phase,
+                    "seconds": round(elapsed, 4),
+                    "requests": requests_made,
+                    "bytes_served": after["bytes"] - before["bytes"],
+                    "files": len(harvester.local_map),
+                    "peak_traced_bytes": (
+                        tracemalloc.get_traced_memory()[1] if trace_memory else None
+                    ),
+                })
+        return timed
+
+    for phase, name in PHASES:
+        setattr(harvester, name, wrap(phase, name, getattr(harvester, name)))
+    return results
+
+
+def print_report(report: dict) -> None:
+    print(f"\nBenchmark: {report['site']}  "
+          f"(latency {report['latency']}s, error rate {report['error_rate']})")
+    print(f"{'phase':10s} {'seconds':>9s} {'requests':>9s} {'req/s':>8s} "
+          f"{'MB':>8s} {'files':>7s} {'peak MB':>8s}")
+    for r in report["phases"]:
+        n = sum(r["requests"].values())
+        rate = n / r["seconds"] if r["seconds"] else 0.0
+        peak = r["peak_traced_bytes"]
+        peak_mb = f"{peak / 1e6:8.1f}" if peak is not None else f"{'-':>8s}"
+        print(f"{r['phase']:10s} {r['seconds']:9.3f} {n:9d} {rate:8.1f} "
+              f"{r['bytes_served'] / 1e6:8.2f} {r['files']:7d} {peak_mb}")
+    print(f"{'total':10s} {report['seconds']:9.3f}   "
+          f"max RSS {report['max_rss_mb']:.1f} MB")
+    print("requests by kind:", json.dumps(report["requests"], sort_keys=True))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark harvest_wayback.py against a local Wayback stand-in.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__,
+    )
+    site = parser.add_argument_group("site")
+    site.add_argument("--domain", default="usgin.org")
+    site.add_argument("--pages", type=int, default=250,
+                      help="Synthetic pages (default: 250)")
+    site.add_argument("--stylesheets", type=int, default=20)
+    site.add_argument("--images", type=int, default=200)
+    site.add_argument("--html-size", type=int, default=8000,
+                      help="Bytes per synthetic page (default: 8000)")
+    site.add_argument("--asset-size", type=int, default=4000,
+                      help="Bytes per synthetic image (default: 4000)")
+    site.add_argument("--missing-ratio", type=float, default=0.1,
+                      help="Fraction of images with no capture (default: 0.1)")
+    site.add_argument("--recorded", metavar="DIR",
+                      help="Serve an existing mirror (with manifest.json) instead")
+    server = parser.add_argument_group("stand-in server")
+    server.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds added to every response (default: 0)")
+    server.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered 503 (default: 0)")
+    server.add_argument("--seed", type=int, default=0)
+    server.add_argument("--cdx-page-size", type=int, default=1000,
+                        help="CDX rows per result page, 0 for no pagination "
+                             "(default: 1000)")
+    harvest = parser.add_argument_group("harvester")
+    harvest.add_argument("--delay", type=float, default=0.0)
+    harvest.add_argument("--workers", type=int, default=1)
+    harvest.add_argument("--jobs", type=int, default=1)
+    harvest.add_argument("--rate", type=float, default=None)
+    harvest.add_argument("--adaptive", action="store_true")
+    harvest.add_argument("--dedup", action="store_true")
+    harvest.add_argument("--parser", default="html.parser",
+                         choices=harvest_wayback.HTML_PARSERS)
+    harvest.add_argument("--rewrite-mode", default="serialize",
+                         choices=("serialize", "patch"))
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Track per-phase peak Python memory (slower)")
+    parser.add_argument("--json", metavar="FILE",
+                        help="Also write the report as JSON")
+    parser.add_argument("--keep", metavar="DIR",
+                        help="Harvest into DIR and keep it (default: temp dir)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format="%(asctime)s [%(levelname)s] %(message)s",
+        datefmt="%H:%M:%S",
+    )
+
+    if args.recorded:
+        site_obj = RecordedSite(Path(args.recorded), args.domain)
+        site_desc = f"recorded {args.recorded} ({len(site_obj.files)} files)"
+    else:
+        site_obj = SyntheticSite(
+            args.domain, args.pages, args.stylesheets, args.images,
+            html_size=args.html_size, asset_size=args.asset_size,
+            missing_ratio=args.missing_ratio,
+        )
+        site_desc = f"synthetic {args.pages} pages"
+
+    out_dir = Path(args.keep) if args.keep else Path(tempfile.mkdtemp(prefix="bench_"))
+    if args.trace_memory:
+        tracemalloc.start()
+    try:
+        with StandIn(site_obj, args.latency, args.error_rate, args.seed,
+                     args.cdx_page_size) as standin:
+            harvest_wayback.WAYBACK_CDX = f"{standin.base}/cdx/search/cdx"
+            harvest_wayback.WAYBACK_WEB = f"{standin.base}/web"
+            harvester = WaybackHarvester(
+                domain=args.domain,
+                output_dir=str(out_dir),
+                delay=args.delay,
+                max_retries=5,
+                workers=args.workers,
+                rate=args.rate,
+                adaptive=args.adaptive,
+                cdx_cache_ttl=0,
+                dedup=args.dedup,
+                parser=args.parser,
+                rewrite_mode=args.rewrite_mode,
+                jobs=args.jobs,
+            )
+            phases = instrument(harvester, standin, args.trace_memory)
+            start = time.perf_counter()
+            quiet = io.StringIO()
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else quiet):
+                harvester.run()
+            total = time.perf_counter() - start
+            report = {
+                "site": site_desc,
+                "latency": args.latency,
+                "error_rate": args.error_rate,
+                "seconds": round(total, 4),
+                "phases": phases,
+                "requests": {k: v for k, v in standin.snapshot().items() if k != "bytes"},
+                "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                "metrics": harvester.metrics.to_json(),
+                "harvest": {
+                    "downloaded": harvester.stats.downloaded,
+                    "assets_downloaded": harvester.stats.asset_downloaded,
+                    "failures": len(harvester.stats.failures),
+                    "html_rewritten": harvester.stats.rewritten_html,
+                    "css_rewritten": harvester.stats.rewritten_css,
+                },
+            }
+    finally:
+        if not args.keep:
+            shutil.rmtree(out_dir, ignore_errors=True)
+
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,29 +10,66 @@ Phases:
   2. Download         – fetch every URL via the id_ endpoint (clean, no toolbar)
   3. Asset Discovery  – parse HTML/CSS to find additional assets not in CDX
   4. Link Rewriting   – rewrite internal links to relative local paths
+  4b. Link Check      – optionally check external links (dead_links_report.json)
   5. Report           – print summary, write manifest.json
+  6. Package          – optionally bundle everything as a BagIt .zip/.tar.zst
 
 Usage:
   python harvest_wayback.py                    # defaults
   python harvest_wayback.py --delay 0.5 -v     # faster, verbose
   python harvest_wayback.py --resume            # resume after interruption
+  python harvest_wayback.py --retry-failed-only # fetch only failed URLs again
+  python harvest_wayback.py --incremental       # fetch only new/changed captures
   python harvest_wayback.py --skip-rewrite      # download only, no rewriting
+  python harvest_wayback.py --workers 8 --rate 4  # concurrent downloads
+  python harvest_wayback.py --workers 8 --adaptive  # rate follows the archive
+  python harvest_wayback.py --cdx-cache-only    # replay cached CDX listings
+  python harvest_wayback.py --dedup             # fetch each payload once
+  python harvest_wayback.py --parser lxml --rewrite-mode patch
+  python harvest_wayback.py --jobs 4            # parse/rewrite on 4 cores
+  python harvest_wayback.py --max-depth 2 --max-assets 500  # bounded crawl
+  python harvest_wayback.py --plan --rate 2     # size and time a harvest first
+  python harvest_wayback.py --max-bytes 2G --prefer html,css,png,pdf
+  python harvest_wayback.py --check-links-only  # re-check external links
+  python harvest_wayback.py --target usgin.org --target lab.usgin.org@2016 --workers 4
+  python harvest_wayback.py --warc warc --wacz  # also keep raw responses
+  python harvest_wayback.py --package usgin.zip  # checksummed deposit bag
+  python harvest_wayback.py --trace trace.json  # timeline for chrome://tracing
 """
 
 import argparse
+import base64
+import bisect
+import gzip
 import hashlib
+import html
+import io
 import json
 import logging
 import mimetypes
 import os
+import queue
 import re
 import shutil
+import struct
 import sys
+import tarfile
+import tempfile
+import threading
 import time
-from collections import defaultdict
+import uuid
+import zipfile
+import zlib
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager, nullcontext, suppress as contextlib_suppress
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field, asdict
+from functools import lru_cache
+from itertools import islice, zip_longest
+from html.parser import HTMLParser
 from pathlib import Path, PurePosixPath
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 from urllib.parse import (
     urljoin,
     urlparse,
@@ -43,6 +80,13 @@ from urllib.parse import (
 
 import requests
 from bs4 import BeautifulSoup
+from bs4.builder import builder_registry
+from bs4.dammit import EncodingDetector
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed for .tar.zst bundles
+    zstandard = None
 
 # ---------------------------------------------------------------------------
 # Data classes
@@ -50,14 +94,49 @@ from bs4 import BeautifulSoup
 
 @dataclass
 class CdxEntry:
-    """One row from the CDX API."""
+    """One row from the CDX API, kept compact for large listings."""
+    __slots__ = (
+        "urlkey", "timestamp", "original", "mimetype", "statuscode",
+        "digest", "length",
+    )
     urlkey: str
-    timestamp: str
+    timestamp: int
     original: str
     mimetype: str
     statuscode: str
     digest: str
-    length: str
+    length: int
+
+    @classmethod
+    def from_row(cls, row: list) -> "CdxEntry":
+        """Build from a CDX_FIELDS row; repeated short strings are interned."""
+        urlkey, timestamp, original, mimetype, statuscode, digest, length = row[:7]
+        return cls(
+            urlkey,
+            int(timestamp),
+            original,
+            sys.intern(mimetype),
+            sys.intern(statuscode),
+            digest,
+            int(length) if length.isdigit() else 0,
+        )
+
+
+@dataclass
+class HtmlRef:
+    """One URL-bearing location in a parsed HTML document."""
+    tag: object         # bs4 Tag holding the reference
+    attr: str           # attribute name; "" for the text of a <style> block
+    kind: str           # "url", "srcset" or "css"
+
+
+@dataclass
+class HtmlSpan:
+    """Byte range of a URL-bearing value in an undecoded HTML document."""
+    start: int
+    end: int
+    kind: str           # "url", "srcset", "style" (attribute) or "css" (block)
+    quote: str          # attribute quote character; "" if unquoted or a block
 
 
 @dataclass
@@ -73,9 +152,1138 @@ class HarvestStats:
     rewritten_css: int = 0
     failures: list = field(default_factory=list)
     bytes_total: int = 0
+    deduplicated: int = 0
+    digest_mismatches: int = 0
+    unchanged: int = 0
+    known_missing: int = 0
+    over_budget: int = 0
     by_extension: dict = field(default_factory=lambda: defaultdict(int))
 
 
+class TokenBucket:
+    """Thread-safe token bucket shared by all download workers.
+
+    Tokens refill at ``rate`` per second up to ``capacity``; ``acquire()``
+    blocks until a token is available, so the combined request rate of all
+    workers never exceeds the politeness budget.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                wait = (1.0 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveRateLimiter(TokenBucket):
+    """Token bucket whose rate follows the archive's responses (AIMD).
+
+    Every healthy response raises the rate by ``step`` requests/second up
+    to ``max_rate``; a throttling response or connection error halves it
+    (at most once per current request interval, down to ``min_rate``) and
+    honours any Retry-After by holding back all callers until it passes.
+    """
+
+    def __init__(
+        self, rate: float, max_rate: float, min_rate: float = 0.05,
+        step: float = 0.1, capacity: float = 1.0,
+    ):
+        super().__init__(min(rate, max_rate), capacity)
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.step = step
+        self.resume_at = 0.0
+        self.last_decrease = 0.0
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                wait = self.resume_at - time.monotonic()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        super().acquire()
+
+    def succeeded(self) -> None:
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.step)
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_decrease >= 1.0 / self.rate:
+                self.rate = max(self.min_rate, self.rate / 2)
+                self.last_decrease = now
+            # Drop any saved-up burst so the slower rate applies at once
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.resume_at = max(self.resume_at, now + retry_after)
+
+
+# Process umask, read once at import (os.umask can only be read by setting it)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomic_write(full_path: Path, chunks) -> tuple[int, str]:
+    """Stream byte chunks to a temp file, then rename it over ``full_path``.
+
+    Returns ``(size, sha1_hex)`` computed on the fly.  Readers never see a
+    partially written file: on any error the temp file is removed and the
+    exception propagates.
+    """
+    full_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(
+        dir=full_path.parent, prefix=f".{full_path.name}.", suffix=".part"
+    )
+    sha1 = hashlib.sha1()
+    size = 0
+    try:
+        # mkstemp creates 0600 files; give them the usual umask-based mode
+        os.chmod(tmp_name, 0o666 & ~_UMASK)
+        with os.fdopen(fd, "wb") as fh:
+            for chunk in chunks:
+                if not chunk:
+                    continue
+                fh.write(chunk)
+                sha1.update(chunk)
+                size += len(chunk)
+        os.replace(tmp_name, full_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    return size, sha1.hexdigest()
+
+
+def tee_chunks(chunks, kept: bytearray, limit: int):
+    """Pass byte chunks through, copying them into ``kept`` up to ``limit``.
+
+    Once the stream outgrows ``limit`` copying stops, so the copy is the
+    whole stream only if its length equals the number of bytes written.
+    """
+    for chunk in chunks:
+        if len(kept) + len(chunk) <= limit:
+            kept += chunk
+        yield chunk
+
+
+class CdxCache:
+    """On-disk cache of raw CDX responses, one gzipped JSON-lines file per query.
+
+    Entries are keyed on the full query parameters and expire after
+    ``ttl`` seconds, except in ``offline`` mode, which replays whatever
+    is cached regardless of age and never allows a network fetch.
+    """
+
+    def __init__(self, cache_dir: Path, ttl: float, offline: bool = False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.offline = offline
+
+    def _path(self, params: dict) -> Path:
+        key = json.dumps(params, sort_keys=True)
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{name}.jsonl.gz"
+
+    def get(self, params: dict) -> Optional[Iterator[list]]:
+        """Return cached rows for a query as an iterator, or None if
+        missing or stale."""
+        path = self._path(params)
+        try:
+            fh = gzip.open(path, "rt", encoding="utf-8")
+        except OSError:
+            return None
+        try:
+            header = json.loads(fh.readline())
+            stale = time.time() - header["fetched_at"] > self.ttl
+        except (OSError, EOFError, ValueError, KeyError):
+            fh.close()
+            return None
+        if stale and not self.offline:
+            fh.close()
+            return None
+
+        def rows():
+            with fh:
+                for line in fh:
+                    yield json.loads(line)
+        return rows()
+
+    @contextmanager
+    def put(self, params: dict):
+        """Store a query's rows as they arrive: yields a function taking
+        one row.  The entry is kept only if the block completes."""
+        path = self._path(params)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.open(raw, "wt", encoding="utf-8") as fh:
+                fh.write(json.dumps({"fetched_at": time.time(), "params": params}) + "\n")
+                yield lambda row: fh.write(json.dumps(row) + "\n")
+            os.chmod(tmp, 0o666 & ~_UMASK)
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib_suppress(OSError):
+                os.unlink(tmp)
+            raise
+
+
+def cdx_digest(sha1_hex: str) -> str:
+    """Convert a hex SHA-1 to the base32 form used in CDX ``digest``."""
+    return base64.b32encode(bytes.fromhex(sha1_hex)).decode("ascii")
+
+
+def parse_cdx_lines(lines: Iterable[bytes]) -> Iterator[list]:
+    """Yield rows from CDX ``output=json`` text, one line at a time.
+
+    The CDX server writes one row per line (``[["urlkey",...],``, ``["..."],``,
+    ... ``]``), so each line is decoded on its own and memory stays flat.
+    Lines holding several rows, such as a whole response on one line, fall
+    back to parsing the line as a list.  Raises ValueError on bad JSON.
+    """
+    for line in lines:
+        line = line.strip().rstrip(b",")
+        if line.startswith(b"[["):
+            line = line[1:]
+        if line.endswith(b"]]"):
+            line = line[:-1]
+        if not line or line in (b"[", b"]", b"[]"):
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            yield from json.loads(b"[" + line + b"]")
+            continue
+        if row:
+            yield row
+
+
+def parse_size(text: str) -> int:
+    """``"500M"`` -> bytes; K/M/G/T suffixes are binary, none means bytes."""
+    text = text.strip().upper().removesuffix("B").removesuffix("I")
+    scale = 1
+    if text and text[-1] in "KMGT":
+        scale = 1 << (10 * ("KMGT".index(text[-1]) + 1))
+        text = text[:-1]
+    try:
+        value = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"bad size {text!r} (e.g. 500M, 2G)")
+    return int(value * scale)
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m {seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class BlobStore:
+    """Store of raw payloads keyed on the CDX digest they were listed with.
+
+    Each payload is kept once under ``<root>/<digest[:2]>/<digest>`` and
+    hard-linked (or copied, where links are unsupported) into every local
+    path that shares it.  Payloads fetched without a CDX digest are kept
+    under their computed one.  Files are only replaced atomically elsewhere in
+    the harvester, so rewriting a linked file never alters the blob.
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def has(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def lock(self, digest: str) -> threading.Lock:
+        """Per-digest lock so concurrent workers fetch a payload only once."""
+        with self._locks_guard:
+            return self._locks.setdefault(digest, threading.Lock())
+
+    @staticmethod
+    def _link(src: Path, dst: Path) -> None:
+        """Atomically place a hard link (or copy) of ``src`` at ``dst``."""
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dst.with_name(
+            f".{dst.name}.{os.getpid()}.{threading.get_ident()}.link"
+        )
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copy2(src, tmp)
+        os.replace(tmp, dst)
+
+    def add(self, digest: str, full_path: Path) -> None:
+        """Store a verified file under its digest (no-op if present)."""
+        if not self.has(digest):
+            self._link(full_path, self.path(digest))
+
+    def link_to(self, digest: str, full_path: Path) -> int:
+        """Materialize a stored payload at ``full_path``; return its size."""
+        blob = self.path(digest)
+        self._link(blob, full_path)
+        return blob.stat().st_size
+
+
+class DownloadJournal:
+    """Append-only log of finished downloads and failures.
+
+    One JSON object per line: ``{"url", "original", "timestamp",
+    "digest", "path", "size"}`` once a file has been renamed into place,
+    or ``{"url", "original", "phase", "failed": true}``.  Lines are
+    fsynced in batches (every JOURNAL_SYNC_RECORDS records or
+    JOURNAL_SYNC_SECONDS), so a crash loses at most the last batch, whose
+    URLs are simply fetched again; a torn last line is dropped.
+
+    Link rewriting adds ``{"rewritten": path, "url", "sha1", "refs"}``,
+    flushed before the rewritten file replaces the downloaded one: the
+    SHA-1 of the new content tells --resume whether the replacement
+    happened, and ``refs`` keeps the URLs the original file linked to,
+    which can no longer be read from the rewritten one.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._fh = None
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+        # From replay(): path -> rewrite records since its last download
+        self.rewrites: dict[str, list[dict]] = {}
+
+    def open(self, truncate: bool = False) -> None:
+        """Start appending (or start afresh, for a new harvest)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if not truncate and self.path.exists():
+            # Cut a torn last line so the next record starts on its own
+            with open(self.path, "r+b") as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - 65536))
+                tail = f.read()
+                keep = size - len(tail) + tail.rfind(b"\n") + 1
+                if keep != size:
+                    f.truncate(keep)
+        self._fh = open(self.path, "wb" if truncate else "ab")
+
+    def attach(self) -> None:
+        """Append to a journal another process has open (--jobs workers).
+
+        Every record is then flushed as one write, so lines from several
+        processes never interleave.
+        """
+        self._fh = open(self.path, "ab")
+
+    @property
+    def is_open(self) -> bool:
+        return self._fh is not None
+
+    def record(self, entry: dict, flush: bool = False) -> None:
+        """Append ``entry``; with ``flush``, hand it to the OS before returning."""
+        line = json.dumps(entry, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self.lock:
+            if self._fh is None:
+                return
+            self._fh.write(line)
+            self._unsynced += 1
+            if (self._unsynced >= JOURNAL_SYNC_RECORDS
+                    or time.monotonic() - self._synced_at >= JOURNAL_SYNC_SECONDS):
+                self._sync()
+            elif flush:
+                self._fh.flush()
+
+    def flush(self) -> None:
+        with self.lock:
+            if self._fh is not None:
+                self._fh.flush()
+
+    def _sync(self) -> None:
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._synced_at = time.monotonic()
+
+    def close(self) -> None:
+        with self.lock:
+            if self._fh is not None:
+                self._sync()
+                self._fh.close()
+                self._fh = None
+
+    def replay(self) -> Optional[dict[str, dict]]:
+        """Latest record per normalized URL, or None if there is no journal."""
+        try:
+            f = open(self.path, "rb")
+        except OSError:
+            return None
+        records: dict[str, dict] = {}
+        self.rewrites = {}
+        with f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "rewritten" in entry:
+                    self.rewrites.setdefault(entry["rewritten"], []).append(entry)
+                    continue
+                if "path" in entry:
+                    # Downloaded again: earlier rewrites were overwritten
+                    self.rewrites.pop(entry["path"], None)
+                records[entry["url"]] = entry
+        return records
+
+
+class MissCache:
+    """URLs known to be missing from the archive, remembered across runs.
+
+    ``url -> [reason, checked_at, timestamp]``, where reason is
+    "no_capture" (no CDX capture, and the id_ fetch found nothing) or
+    "not_found" (the CDX capture at ``timestamp`` answered 404/410).
+    Entries older than ``ttl`` seconds, or for a different capture than
+    the one now listed, are ignored so the URL is tried again.
+    """
+
+    def __init__(self, path: Path, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: dict[str, list] = {}
+        self._dirty = False
+        try:
+            self.entries = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            pass
+
+    def reason(self, url: str, timestamp: Optional[str] = None) -> Optional[str]:
+        """Why ``url`` is known to be missing, or None if it should be tried."""
+        entry = self.entries.get(url)
+        if entry is None or time.time() - entry[1] >= self.ttl:
+            return None
+        if timestamp and entry[2] and entry[2] != timestamp:
+            return None
+        return entry[0]
+
+    def add(self, url: str, reason: str, timestamp: Optional[str] = None) -> None:
+        with self.lock:
+            self.entries[url] = [reason, time.time(), timestamp]
+            self._dirty = True
+
+    def discard(self, url: str) -> None:
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                self._dirty = True
+
+    def save(self) -> None:
+        with self.lock:
+            if self._dirty:
+                atomic_write(self.path, [json.dumps(self.entries).encode("utf-8")])
+                self._dirty = False
+
+
+class HtmlSpanScanner(HTMLParser):
+    """Locate URL-bearing attribute values and <style> text by offset.
+
+    Feed it the document decoded as latin-1, so character offsets equal
+    byte offsets in the original buffer.  No tree is built; ``spans``
+    lists every value the link rewriter may need to patch, in order.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.spans: list[HtmlSpan] = []
+        self._line_starts: list[int] = [0]
+        self._in_style = False
+
+    def feed(self, data: str) -> None:
+        self._line_starts = [0]
+        self._line_starts.extend(m.end() for m in re.finditer("\n", data))
+        super().feed(data)
+
+    def _offset(self) -> int:
+        line, col = self.getpos()
+        return self._line_starts[line - 1] + col
+
+    def handle_starttag(self, tag, attrs):
+        wanted = set(HTML_URL_ATTRS.get(tag, ()))
+        if tag in SRCSET_TAGS:
+            wanted.add("srcset")
+        start = self._offset()
+        raw = self.get_starttag_text() or ""
+        for m in HTML_ATTR_SPAN_RE.finditer(raw, 1 + len(tag)):
+            name = m.group("name").lower()
+            if name == "style":
+                kind = "style"
+            elif name in wanted:
+                kind = "srcset" if name == "srcset" else "url"
+            else:
+                continue
+            for group, quote in (("dq", '"'), ("sq", "'"), ("uq", "")):
+                if m.group(group) is not None:
+                    s, e = m.span(group)
+                    self.spans.append(HtmlSpan(start + s, start + e, kind, quote))
+                    break
+        if tag == "style":
+            self._in_style = True
+
+    def handle_endtag(self, tag):
+        if tag == "style":
+            self._in_style = False
+
+    def handle_data(self, data):
+        if self._in_style:
+            start = self._offset()
+            self.spans.append(HtmlSpan(start, start + len(data), "css", ""))
+
+
+class LinkGraph:
+    """Bidirectional index of internal links between local files.
+
+    ``outgoing`` maps a source file to the normalized URLs it references,
+    as found during discovery; ``incoming`` is the reverse, so the files
+    to rewrite when one URL's local file appears or moves are a lookup
+    rather than a rescan of the archive.
+    """
+
+    def __init__(self):
+        self.outgoing: dict[Path, set[str]] = {}
+        self.incoming: dict[str, set[Path]] = defaultdict(set)
+
+    def get(self, source: Path) -> Optional[set[str]]:
+        """URLs referenced by ``source``, or None if it was never scanned."""
+        return self.outgoing.get(source)
+
+    def record(self, source: Path, urls: set[str]) -> None:
+        self.discard(source)
+        self.outgoing[source] = urls
+        for url in urls:
+            self.incoming[url].add(source)
+
+    def discard(self, source: Path) -> None:
+        for url in self.outgoing.pop(source, ()):
+            sources = self.incoming.get(url)
+            if sources is not None:
+                sources.discard(source)
+                if not sources:
+                    del self.incoming[url]
+
+    def sources(self, urls) -> set[Path]:
+        """Files linking to any of ``urls``."""
+        found: set[Path] = set()
+        for url in urls:
+            found.update(self.incoming.get(url, ()))
+        return found
+
+    def to_json(self, keep: set[Path]) -> dict:
+        return {
+            source.as_posix(): sorted(urls)
+            for source, urls in self.outgoing.items() if source in keep
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "LinkGraph":
+        graph = cls()
+        for source, urls in data.items():
+            graph.record(Path(source), set(urls))
+        return graph
+
+
+class HarvestMetrics:
+    """Timing, request histograms and retry counts for one harvest.
+
+    ``span()`` times a block under a category: "phase" blocks give the
+    wall time of each pipeline phase, while "network", "sleep" and
+    "parse" blocks are summed over all threads (so with --workers they
+    can exceed the wall time).  Requests are bucketed by kind ("cdx" or
+    "content") and status code.  With a trace file, every span and
+    request is also written out as an event as it completes.
+    """
+
+    def __init__(self, trace_path: Optional[Path] = None):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.seconds: dict[str, float] = defaultdict(float)
+        self.retries: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        # kind -> status -> counters and histogram buckets
+        self.requests: dict[str, dict[str, dict]] = defaultdict(dict)
+        self._trace = None
+        self._trace_jsonl = False
+        if trace_path is not None:
+            trace_path.parent.mkdir(parents=True, exist_ok=True)
+            self._trace_jsonl = trace_path.suffix == ".jsonl"
+            self._trace = open(trace_path, "w", encoding="utf-8")
+            if not self._trace_jsonl:
+                self._trace.write("[\n")
+
+    @contextmanager
+    def span(self, category: str, name: str, **args):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                if category == "phase":
+                    self.phases[name] = self.phases.get(name, 0.0) + elapsed
+                else:
+                    self.seconds[category] += elapsed
+            self._event(category, name, start, elapsed, args)
+
+    def _bucket(self, kind: str, status: int) -> dict:
+        bucket = self.requests[kind].get(str(status))
+        if bucket is None:
+            bucket = self.requests[kind][str(status)] = {
+                "count": 0,
+                "seconds": 0.0,
+                "latency": [0] * (len(LATENCY_BUCKETS) + 1),
+                "bytes": 0,
+                "sizes": [0] * (len(SIZE_BUCKETS) + 1),
+            }
+        return bucket
+
+    def request(
+        self, kind: str, status: int, start: float, seconds: float,
+        url: str = "",
+    ) -> None:
+        """Record one HTTP response (latency up to its headers)."""
+        with self.lock:
+            bucket = self._bucket(kind, status)
+            bucket["count"] += 1
+            bucket["seconds"] += seconds
+            self.seconds["network"] += seconds
+            bucket["latency"][bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self._event("request", kind, start, seconds, {"status": status, "url": url[:200]})
+
+    def size(self, kind: str, status: int, nbytes: int) -> None:
+        """Record the body size of a response recorded with request()."""
+        with self.lock:
+            bucket = self._bucket(kind, status)
+            bucket["bytes"] += nbytes
+            bucket["sizes"][bisect.bisect_left(SIZE_BUCKETS, nbytes)] += 1
+
+    def retry(self, kind: str, reason: str) -> None:
+        with self.lock:
+            self.retries[kind][reason] += 1
+
+    def _event(
+        self, category: str, name: str, start: float, seconds: float,
+        args: dict,
+    ) -> None:
+        if self._trace is None:
+            return
+        event = {
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self.started) * 1e6),
+            "dur": round(seconds * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        line = json.dumps(event) + ("\n" if self._trace_jsonl else ",\n")
+        with self.lock:
+            self._trace.write(line)
+
+    def close(self) -> None:
+        """Finish the trace file, if any."""
+        if self._trace is None:
+            return
+        if not self._trace_jsonl:
+            # Every event ends in a comma; close the array on a metadata
+            # record so the file is valid JSON
+            self._trace.write(json.dumps({
+                "name": "process_name", "ph": "M", "pid": os.getpid(),
+                "args": {"name": "harvest_wayback"},
+            }) + "\n]\n")
+        self._trace.close()
+        self._trace = None
+
+    def to_json(self) -> dict:
+        def histogram(counts, bounds):
+            # Non-cumulative counts keyed by each bucket's upper bound
+            labels = [f"{b:g}" for b in bounds] + ["inf"]
+            return {label: n for label, n in zip(labels, counts) if n}
+
+        with self.lock:
+            return {
+                "elapsed_seconds": round(time.perf_counter() - self.started, 3),
+                "phase_seconds": {k: round(v, 3) for k, v in self.phases.items()},
+                "thread_seconds": {
+                    k: round(v, 3) for k, v in sorted(self.seconds.items())
+                },
+                "retries": {k: dict(v) for k, v in self.retries.items()},
+                "requests": {
+                    kind: {
+                        status: {
+                            "count": b["count"],
+                            "latency_seconds_total": round(b["seconds"], 3),
+                            "latency_histogram": histogram(b["latency"], LATENCY_BUCKETS),
+                            "bytes_total": b["bytes"],
+                            "size_histogram": histogram(b["sizes"], SIZE_BUCKETS),
+                        }
+                        for status, b in sorted(by_status.items())
+                    }
+                    for kind, by_status in self.requests.items()
+                },
+            }
+
+
+class LinkChecker:
+    """Concurrent liveness check for external URLs.
+
+    URLs are checked on a thread pool with at most ``per_host`` requests
+    in flight per host, queued round-robin by host so that no single host
+    is worked through in series.  HEAD comes first; a failed or rejected
+    HEAD is retried as a streamed GET.  Results (None for live, else a
+    reason such as "404" or "ConnectionError") are cached in a JSON file
+    for ``ttl`` seconds.
+    """
+
+    def __init__(
+        self, cache_path: Path, ttl: float, workers: int = 16,
+        per_host: int = 2, timeout: float = 10.0,
+        metrics: Optional[HarvestMetrics] = None,
+    ):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.metrics = metrics
+        self.session = requests.Session()
+        self.session.headers.update({
+            "User-Agent": "usgin-archive-harvester/1.0 (link check)"
+        })
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=workers, pool_maxsize=per_host
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.lock = threading.Lock()
+        self.hosts: dict[str, threading.BoundedSemaphore] = {}
+        self.cache: dict[str, list] = {}
+        if ttl > 0:
+            try:
+                self.cache = json.loads(cache_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                pass
+
+    def check(self, urls) -> dict[str, Optional[str]]:
+        """Check each URL once; return url -> None (live) or dead reason."""
+        results: dict[str, Optional[str]] = {}
+        now = time.time()
+        by_host: dict[str, list[str]] = defaultdict(list)
+        for url in urls:
+            cached = self.cache.get(url)
+            if cached is not None and now - cached[1] < self.ttl:
+                results[url] = cached[0]
+            else:
+                by_host[urlparse(url).hostname or ""].append(url)
+        order = [
+            url for batch in zip_longest(*by_host.values())
+            for url in batch if url is not None
+        ]
+        if order:
+            logger.info(
+                "  Checking %d URLs on %d hosts (%d cached)",
+                len(order), len(by_host), len(results),
+            )
+            with thread_pool(self.workers) as pool:
+                for url, reason in zip(order, pool.map(self._check_one, order)):
+                    results[url] = reason
+                    self.cache[url] = [reason, now]
+            if self.ttl > 0:
+                atomic_write(self.cache_path, [json.dumps(self.cache).encode("utf-8")])
+        return results
+
+    def _request(self, method: str, url: str) -> requests.Response:
+        start = time.perf_counter()
+        try:
+            resp = self.session.request(
+                method, url, allow_redirects=True, stream=True,
+                timeout=(min(5.0, self.timeout), self.timeout),
+            )
+        except Exception:
+            if self.metrics is not None:
+                self.metrics.request(
+                    "external", "error", start, time.perf_counter() - start, url
+                )
+            raise
+        resp.close()
+        if self.metrics is not None:
+            self.metrics.request(
+                "external", resp.status_code, start,
+                time.perf_counter() - start, url,
+            )
+        return resp
+
+    def _check_one(self, url: str) -> Optional[str]:
+        host = urlparse(url).hostname or ""
+        with self.lock:
+            slot = self.hosts.setdefault(host, threading.BoundedSemaphore(self.per_host))
+        with slot:
+            try:
+                if self._request("HEAD", url).status_code < 400:
+                    return None
+            except Exception:
+                pass  # some servers mishandle HEAD; GET decides
+            try:
+                resp = self._request("GET", url)
+            except requests.ConnectionError:
+                return "ConnectionError"
+            except requests.Timeout:
+                return "Timeout"
+            except Exception as exc:
+                return type(exc).__name__
+            return None if resp.status_code < 400 else str(resp.status_code)
+
+
+def surt_key(url: str) -> str:
+    """SURT-style sort key for CDXJ: reversed host, lowercased path."""
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    key = ",".join(reversed(host.split("."))) + ")" + (parsed.path or "/").lower()
+    if parsed.query:
+        key += "?" + parsed.query.lower()
+    return key
+
+
+class WarcWriter:
+    """Per-record gzipped WARC/1.1 output with a CDXJ index.
+
+    Each record is its own gzip member, so a CDXJ line's offset and
+    length are enough to read it with one seek.  Writers take an idle
+    file from a pool and return it afterwards, so concurrent downloads
+    write to separate files; a file is retired once it passes
+    ``max_size`` bytes.  Payloads are copied in chunks from the file the
+    download was just streamed to, never held in memory whole.
+    """
+
+    # Hop-by-hop and encoding headers that no longer describe the stored
+    # (decoded) payload
+    DROP_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection"}
+
+    def __init__(self, directory: Path, prefix: str, max_size: int):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_size = max_size
+        self.started = time.strftime("%Y%m%d%H%M%S", time.gmtime())
+        self.lock = threading.Lock()
+        self.serial = 0
+        self.idle: list = []
+        self.open_files: list = []
+        self.files: list[Path] = []
+        self.index: list[str] = []
+        self.pages: list[dict] = []
+        directory.mkdir(parents=True, exist_ok=True)
+
+    def _acquire(self):
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+            self.serial += 1
+            path = self.directory / f"{self.prefix}-{self.started}-{self.serial:05d}.warc.gz"
+            self.files.append(path)
+        f = open(path, "wb")
+        info = (
+            "software: harvest_wayback.py\r\n"
+            "format: WARC File Format 1.1\r\n"
+        ).encode("utf-8")
+        self._write_record(f, [
+            ("WARC-Type", "warcinfo"),
+            ("WARC-Record-ID", f"<urn:uuid:{uuid.uuid4()}>"),
+            ("WARC-Date", time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())),
+            ("WARC-Filename", path.name),
+            ("Content-Type", "application/warc-fields"),
+        ], [info], len(info))
+        with self.lock:
+            self.open_files.append(f)
+        return f
+
+    def _release(self, f) -> None:
+        if f.tell() >= self.max_size:
+            f.close()
+            with self.lock:
+                self.open_files.remove(f)
+            return
+        with self.lock:
+            self.idle.append(f)
+
+    @staticmethod
+    def _write_record(f, headers: list, chunks, length: int) -> tuple[int, int]:
+        """Write one record as a gzip member; return (offset, length)."""
+        offset = f.tell()
+        with gzip.GzipFile(filename="", fileobj=f, mode="wb", mtime=0) as gz:
+            gz.write(b"WARC/1.1\r\n")
+            for name, value in headers:
+                gz.write(f"{name}: {value}\r\n".encode("utf-8"))
+            gz.write(f"Content-Length: {length}\r\n\r\n".encode("ascii"))
+            for chunk in chunks:
+                gz.write(chunk)
+            gz.write(b"\r\n\r\n")
+        return offset, f.tell() - offset
+
+    def write_response(
+        self, url: str, timestamp: str, resp: requests.Response,
+        payload_path: Path, size: int, sha1_hex: str,
+    ) -> None:
+        """Record ``resp`` (already streamed to ``payload_path``)."""
+        timestamp = timestamp.ljust(14, "0")[:14]
+        http_head = [f"HTTP/1.1 {resp.status_code} {resp.reason or ''}".rstrip()]
+        http_head += [
+            f"{name}: {value}" for name, value in resp.headers.items()
+            if name.lower() not in self.DROP_HEADERS
+        ]
+        http_head.append(f"Content-Length: {size}")
+        head = ("\r\n".join(http_head) + "\r\n\r\n").encode("latin-1", "replace")
+
+        def chunks():
+            yield head
+            with open(payload_path, "rb") as src:
+                while chunk := src.read(DOWNLOAD_CHUNK_SIZE):
+                    yield chunk
+
+        digest = f"sha1:{cdx_digest(sha1_hex)}"
+        headers = [
+            ("WARC-Type", "response"),
+            ("WARC-Record-ID", f"<urn:uuid:{uuid.uuid4()}>"),
+            ("WARC-Date", time.strftime(
+                "%Y-%m-%dT%H:%M:%SZ", time.strptime(timestamp, "%Y%m%d%H%M%S")
+            )),
+            ("WARC-Target-URI", url),
+            ("WARC-Payload-Digest", digest),
+            ("Content-Type", "application/http; msgtype=response"),
+        ]
+        f = self._acquire()
+        try:
+            offset, length = self._write_record(f, headers, chunks(), len(head) + size)
+            filename = Path(f.name).name
+        finally:
+            self._release(f)
+        mime = resp.headers.get("Content-Type", "").split(";")[0].strip()
+        line = json.dumps({
+            "url": url, "mime": mime, "status": str(resp.status_code),
+            "digest": digest, "length": str(length), "offset": str(offset),
+            "filename": filename,
+        })
+        with self.lock:
+            self.index.append(f"{surt_key(url)} {timestamp} {line}")
+            if mime == "text/html":
+                self.pages.append({"url": url, "ts": timestamp})
+
+    def close(self, wacz_path: Optional[Path] = None) -> None:
+        """Close all files and write index.cdxj (and a WACZ, if asked)."""
+        with self.lock:
+            for f in self.open_files:
+                f.close()
+            self.open_files.clear()
+            self.idle.clear()
+        index_path = self.directory / "index.cdxj"
+        atomic_write(index_path, [
+            (line + "\n").encode("utf-8") for line in sorted(self.index)
+        ])
+        if wacz_path is not None:
+            self._write_wacz(wacz_path, index_path)
+
+    def _write_wacz(self, wacz_path: Path, index_path: Path) -> None:
+        """Package the WARCs, index and page list as a WACZ (zip) file."""
+        pages = [json.dumps({
+            "format": "json-pages-1.0", "id": "pages", "title": "All Pages",
+        })] + [json.dumps(page) for page in self.pages]
+        pages_path = self.directory / "pages.jsonl"
+        atomic_write(pages_path, [("\n".join(pages) + "\n").encode("utf-8")])
+        members = [(f"archive/{p.name}", p) for p in self.files if p.exists()]
+        members += [
+            ("indexes/index.cdxj", index_path),
+            ("pages/pages.jsonl", pages_path),
+        ]
+        resources = []
+        with zipfile.ZipFile(wacz_path, "w") as zf:
+            for arcname, path in members:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                # WARCs are already gzipped; store them as they are
+                info.compress_type = (
+                    zipfile.ZIP_STORED if arcname.endswith(".gz")
+                    else zipfile.ZIP_DEFLATED
+                )
+                sha256 = hashlib.sha256()
+                with open(path, "rb") as src, zf.open(info, "w") as dst:
+                    while chunk := src.read(DOWNLOAD_CHUNK_SIZE):
+                        sha256.update(chunk)
+                        dst.write(chunk)
+                resources.append({
+                    "name": path.name,
+                    "path": arcname,
+                    "hash": f"sha256:{sha256.hexdigest()}",
+                    "bytes": path.stat().st_size,
+                })
+            zf.writestr("datapackage.json", json.dumps({
+                "profile": "data-package",
+                "wacz_version": "1.1.1",
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "software": "harvest_wayback.py",
+                "resources": resources,
+            }, indent=2))
+
+
+class HashingReader:
+    """File wrapper that SHA-256 hashes everything read through it."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.f.read(size)
+        self.sha256.update(data)
+        return data
+
+
+def deflate_file(path: Path):
+    """Read a file once: raw-deflate it, and compute its CRC-32 and SHA-256.
+
+    Returns ``(spool, crc, size, compressed_size, sha256_hex)``; the
+    compressed bytes are in ``spool``, a temp file rewound to the start.
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=8 << 20)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    sha256 = hashlib.sha256()
+    crc = size = 0
+    with open(path, "rb") as src:
+        while chunk := src.read(DOWNLOAD_CHUNK_SIZE):
+            sha256.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            spool.write(compressor.compress(chunk))
+    spool.write(compressor.flush())
+    compressed = spool.tell()
+    spool.seek(0)
+    return spool, crc, size, compressed, sha256.hexdigest()
+
+
+class ZipBundleWriter:
+    """Minimal streaming ZIP writer for pre-compressed entries.
+
+    zipfile compresses inside the writing thread; this writer instead
+    takes entries deflated elsewhere (see deflate_file), or copies stored
+    entries straight from disk, hashing them on the way through and
+    putting their CRC and sizes in a trailing data descriptor.  No ZIP64:
+    bundles are limited to 4 GiB and 65535 entries.
+    """
+
+    LOCAL = struct.Struct("<4s2B4HL2L2H")
+    CENTRAL = struct.Struct("<4s4B4HL2L5H2L")
+    DESCRIPTOR = struct.Struct("<4s3L")
+    END = struct.Struct("<4s4H2LH")
+    UTF8 = 0x800
+    HAS_DESCRIPTOR = 0x08
+
+    def __init__(self, f):
+        self.f = f
+        self.entries: list[tuple] = []
+
+    @staticmethod
+    def _dos_time(mtime: float) -> tuple[int, int]:
+        t = time.localtime(max(mtime, 315532800))  # ZIP dates start in 1980
+        return (
+            t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+            (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday,
+        )
+
+    def _local_header(self, name: bytes, flags, method, mtime, crc, csize, size):
+        dos_time, dos_date = self._dos_time(mtime)
+        self.f.write(self.LOCAL.pack(
+            b"PK\x03\x04", 20, 0, flags, method, dos_time, dos_date,
+            crc, csize, size, len(name), 0,
+        ))
+        self.f.write(name)
+
+    def _check_limits(self) -> None:
+        if self.f.tell() > 0xFFFFFFFF or len(self.entries) >= 0xFFFF:
+            raise ValueError("ZIP bundle exceeds 4 GiB / 65535 entries; use .tar.zst")
+
+    def add_deflated(self, arcname: str, spool, crc, size, compressed, mtime) -> None:
+        name = arcname.encode("utf-8")
+        offset = self.f.tell()
+        self._local_header(name, self.UTF8, zipfile.ZIP_DEFLATED, mtime, crc, compressed, size)
+        shutil.copyfileobj(spool, self.f, DOWNLOAD_CHUNK_SIZE)
+        self.entries.append((name, self.UTF8, zipfile.ZIP_DEFLATED, mtime, crc, compressed, size, offset))
+        self._check_limits()
+
+    def add_stored(self, arcname: str, path: Path) -> str:
+        """Copy a file uncompressed; return its SHA-256 hex digest."""
+        name = arcname.encode("utf-8")
+        flags = self.UTF8 | self.HAS_DESCRIPTOR
+        mtime = path.stat().st_mtime
+        offset = self.f.tell()
+        self._local_header(name, flags, zipfile.ZIP_STORED, mtime, 0, 0, 0)
+        sha256 = hashlib.sha256()
+        crc = size = 0
+        with open(path, "rb") as src:
+            while chunk := src.read(DOWNLOAD_CHUNK_SIZE):
+                sha256.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+                self.f.write(chunk)
+        self.f.write(self.DESCRIPTOR.pack(b"PK\x07\x08", crc, size, size))
+        self.entries.append((name, flags, zipfile.ZIP_STORED, mtime, crc, size, size, offset))
+        self._check_limits()
+        return sha256.hexdigest()
+
+    def add_bytes(self, arcname: str, data: bytes) -> None:
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        packed = compressor.compress(data) + compressor.flush()
+        self.add_deflated(
+            arcname, io.BytesIO(packed), zlib.crc32(data), len(data),
+            len(packed), time.time(),
+        )
+
+    def close(self) -> None:
+        """Write the central directory."""
+        start = self.f.tell()
+        for name, flags, method, mtime, crc, csize, size, offset in self.entries:
+            dos_time, dos_date = self._dos_time(mtime)
+            self.f.write(self.CENTRAL.pack(
+                b"PK\x01\x02", 20, 3, 20, 0, flags, method, dos_time,
+                dos_date, crc, csize, size, len(name), 0, 0, 0, 0,
+                (0o100644 << 16), offset,
+            ))
+            self.f.write(name)
+        end = self.f.tell()
+        self.f.write(self.END.pack(
+            b"PK\x05\x06", 0, 0, len(self.entries), len(self.entries),
+            end - start, start, 0,
+        ))
+
+
 # ---------------------------------------------------------------------------
 # Constants
 # ---------------------------------------------------------------------------
@@ -83,6 +1291,26 @@ class HarvestStats:
 WAYBACK_CDX = "https://web.archive.org/cdx/search/cdx"
 WAYBACK_WEB = "https://web.archive.org/web"
 
+# Harvester state (caches, indexes) lives here, inside the output dir
+STATE_DIR = ".harvest"
+CDX_FIELDS = "urlkey,timestamp,original,mimetype,statuscode,digest,length"
+
+# Domain listings are fetched page by page through the CDX pagination
+# API (showNumPages/page), up to --workers pages at once.  Servers without
+# pagination get one query capped at CDX_DOMAIN_LIMIT rows.
+CDX_DOMAIN_LIMIT = 100000
+CDX_PAGE_TIMEOUT = 120
+# Entries handed from page fetchers to the merge, and batches in flight
+CDX_MERGE_BATCH = 1000
+CDX_MERGE_QUEUE = 16
+# Raised by a CDX listing that breaks off or turns malformed mid-stream
+CDX_STREAM_ERRORS = (ValueError, requests.RequestException)
+
+# Batch timestamp resolution: directories with at least this many
+# discovered assets are resolved with one matchType=prefix CDX query.
+CDX_BATCH_MIN_GROUP = 2
+CDX_PREFIX_LIMIT = 10000
+
 EXCLUDED_PATTERNS = [
     re.compile(r"cgi-sys/suspendedpage\.cgi"),
     re.compile(r"user/login"),
@@ -94,6 +1322,104 @@ EXCLUDED_PATTERNS = [
     re.compile(r"^data:"),
     re.compile(r"^#"),
 ]
+# The same exclusions as one alternation, for a single scan per URL
+EXCLUDED_RE = re.compile("|".join(f"(?:{p.pattern})" for p in EXCLUDED_PATTERNS))
+
+# Memoized (ref, base URL) resolutions; nav menus and theme assets repeat
+# on every page
+RESOLVE_CACHE_SIZE = 1 << 16
+
+# Attributes holding a single URL, per tag (discovery and rewriting)
+HTML_URL_ATTRS = {
+    "a": ("href",),
+    "link": ("href",),
+    "script": ("src",),
+    "img": ("src",),
+    "source": ("src",),
+    "video": ("src", "poster"),
+    "audio": ("src",),
+    "object": ("data",),
+    "embed": ("src",),
+}
+SRCSET_TAGS = {"img", "source"}
+
+# url() and @import references in CSS, matched in a single scan
+CSS_REF_RE = re.compile(
+    r'@import\s+(?:url\s*\(\s*)?["\']?(?P<imp>[^"\')\s;]+)["\']?\s*\)?'
+    r'|url\s*\(\s*["\']?(?P<url>[^"\')\s]+)["\']?\s*\)'
+)
+
+# One attribute in a raw start tag, with the value span by quoting style
+HTML_ATTR_SPAN_RE = re.compile(
+    r'(?P<name>[^\s/>"\'=]+)'
+    r'(?:\s*=\s*(?:"(?P<dq>[^"]*)"|\'(?P<sq>[^\']*)\'|(?P<uq>[^\s>]+)))?'
+)
+
+# BeautifulSoup tree builders selectable with --parser
+HTML_PARSERS = ("html.parser", "lxml", "html5lib")
+
+# Parsed HTML trees kept between discovery and rewriting
+PARSE_CACHE_SIZE = 128
+
+# HTML/CSS payloads up to this size are kept in memory as they download
+# and parsed on arrival, at most PIPELINE_MAX_PENDING awaiting the parser
+PIPELINE_PAYLOAD_MAX = 4 << 20
+PIPELINE_MAX_PENDING = 64
+
+# Responses worth retrying after a pause, and the longest Retry-After
+# we are willing to honour
+RETRY_STATUSES = {429, 503, 504, 520, 521, 522, 523, 524}
+MAX_RETRY_AFTER = 300
+# Returned by WaybackHarvester._get_attempt() when the request should be
+# tried again
+RETRY = object()
+
+# --adaptive rate ceiling when --rate is not given (requests/second)
+ADAPTIVE_MAX_RATE = 5.0
+
+# Histogram bucket upper bounds for --trace / manifest metrics:
+# response latency in seconds and body size in bytes
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (1 << 10, 4 << 10, 16 << 10, 64 << 10, 256 << 10, 1 << 20, 4 << 20, 16 << 20)
+
+# External link check (--check-links): report file, concurrency, and
+# hosts that refuse bots (403/reset) although the pages are live
+DEAD_LINK_REPORT = "dead_links_report.json"
+LINK_CHECK_WORKERS = 16
+LINK_CHECK_PER_HOST = 2
+LINK_CHECK_TIMEOUT = 10.0
+BOT_BLOCKING_HOSTS = ("drupal.org", "mysql.com", "w3.org", "whitehouse.gov", "nsf.gov")
+
+# Capture timestamp in a served id_ URL
+WAYBACK_TIMESTAMP_RE = re.compile(r"/web/(\d{14})id_/")
+
+# --warc: roll over to a new WARC file past this size (bytes)
+WARC_MAX_SIZE = 1 << 30
+
+# Bundle members stored without recompression (already compressed)
+STORED_EXTENSIONS = {
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".pdf", ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".wacz",
+    ".docx", ".xlsx", ".pptx", ".odt", ".ods",
+    ".mp3", ".mp4", ".webm", ".ogg", ".woff", ".woff2", ".swf",
+}
+
+# Download order under --max-bytes/--max-requests (and the default for
+# --prefer): pages and styling first, big documents and archives last;
+# other extensions come after all of these
+DOWNLOAD_PREFERENCE = (
+    ".html", ".htm", ".css", ".js", ".png", ".gif", ".jpg", ".jpeg",
+    ".svg", ".ico", ".txt", ".xml", ".pdf", ".doc", ".docx", ".ppt",
+    ".pptx", ".xls", ".xlsx", ".zip",
+)
+
+# Chunk size for streamed downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# Download journal (.harvest/journal.jsonl): fsync after this many
+# records or seconds, whichever comes first
+JOURNAL_SYNC_RECORDS = 256
+JOURNAL_SYNC_SECONDS = 2.0
 
 # File extensions that indicate a static asset (not an HTML page)
 ASSET_EXTENSIONS = {
@@ -107,6 +1433,32 @@ ASSET_EXTENSIONS = {
 
 logger = logging.getLogger("harvest")
 
+# Label of the --target a thread works for, if any (see HarvestScheduler)
+_log_context = threading.local()
+
+
+def set_log_label(label: Optional[str]) -> None:
+    """Prefix this thread's log messages with ``[label]`` (None: no prefix)."""
+    _log_context.label = label
+
+
+class TargetLabelFilter(logging.Filter):
+    """Put the emitting thread's target label in front of each record."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        label = getattr(_log_context, "label", None)
+        if label:
+            record.msg = f"[{label}] {record.msg}"
+        return True
+
+
+def thread_pool(max_workers: int, **kwargs) -> ThreadPoolExecutor:
+    """ThreadPoolExecutor whose threads log under the caller's target label."""
+    return ThreadPoolExecutor(
+        max_workers=max_workers, initializer=set_log_label,
+        initargs=(getattr(_log_context, "label", None),), **kwargs,
+    )
+
 # ---------------------------------------------------------------------------
 # Harvester
 # ---------------------------------------------------------------------------
@@ -120,6 +1472,26 @@ class WaybackHarvester:
         delay: float = 1.0,
         max_retries: int = 5,
         verbose: bool = False,
+        workers: int = 1,
+        rate: Optional[float] = None,
+        adaptive: bool = False,
+        cdx_cache_ttl: float = 86400.0,
+        cdx_cache_only: bool = False,
+        dedup: bool = False,
+        parser: str = "html.parser",
+        rewrite_mode: str = "serialize",
+        trace_path: Optional[str] = None,
+        jobs: int = 1,
+        link_cache_ttl: float = 7 * 86400.0,
+        warc_dir: Optional[str] = None,
+        warc_max_size: int = WARC_MAX_SIZE,
+        wacz: bool = False,
+        max_depth: Optional[int] = None,
+        max_assets: Optional[int] = None,
+        miss_cache_ttl: float = 7 * 86400.0,
+        max_bytes: Optional[int] = None,
+        max_requests: Optional[int] = None,
+        prefer: Optional[list[str]] = None,
     ):
         self.domain = domain
         self.target_timestamp = timestamp
@@ -127,67 +1499,382 @@ class WaybackHarvester:
         self.delay = delay
         self.max_retries = max_retries
         self.verbose = verbose
+        self.workers = max(1, workers)
+        # Processes for the CPU-bound parse and rewrite passes
+        self.jobs = max(1, jobs)
+        # Seconds to trust cached external link check results
+        self.link_cache_ttl = link_cache_ttl
+        # Optional budgets for asset discovery: frontier waves, and assets
+        # queued for download over the whole run
+        self.max_depth = max_depth
+        self.max_assets = max_assets
+        self._assets_queued = 0
+        # Download budgets (id_ requests, CDX-listed bytes) spent in
+        # preference order of file extension; see plan_downloads()
+        self.max_bytes = max_bytes
+        self.max_requests = max_requests
+        self.prefer: Optional[tuple[str, ...]] = (
+            tuple(prefer) if prefer
+            else DOWNLOAD_PREFERENCE if max_bytes is not None or max_requests is not None
+            else None
+        )
+        self._budget_bytes = 0
+        self._budget_requests = 0
+        # URLs dropped for the budget, kept out of the asset frontier
+        self._over_budget: set[str] = set()
+        self.plan: dict = {}
+        # BeautifulSoup tree builder, and how rewritten HTML is written:
+        # "serialize" re-encodes the tree, "patch" splices changed values
+        # into the original bytes
+        if builder_registry.lookup(parser) is None:
+            raise ValueError(f"parser backend {parser!r} is not installed")
+        self.parser = parser
+        self.rewrite_mode = rewrite_mode
         self.session = requests.Session()
         self.session.headers.update({
             "User-Agent": "usgin-archive-harvester/1.0 (research archival)"
         })
+        # Concurrent mode: one politeness budget shared by all workers
+        # (rate defaults to the serial --delay spacing) instead of a
+        # per-request sleep.  Adaptive mode (serial or concurrent) starts
+        # from that rate and lets responses move it, up to --rate.
+        self.rate_limiter: Optional[TokenBucket] = None
+        if self.workers > 1:
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1, pool_maxsize=self.workers
+            )
+            self.session.mount("https://", adapter)
+            self.session.mount("http://", adapter)
+        start_rate = 1.0 / delay if delay > 0 else None
+        if adaptive:
+            max_rate = rate or ADAPTIVE_MAX_RATE
+            self.rate_limiter = AdaptiveRateLimiter(
+                start_rate or max_rate, max_rate, capacity=self.workers
+            )
+        elif self.workers > 1 and (rate or start_rate):
+            self.rate_limiter = TokenBucket(
+                rate or start_rate, capacity=self.workers
+            )
+        # Guards stats, local_map and downloaded_urls in concurrent mode
+        self._lock = threading.Lock()
+        # Raw CDX responses are cached so restarts and --cdx-cache-only
+        # runs skip the slow listing queries (ttl <= 0 disables the cache)
+        self.cdx_cache: Optional[CdxCache] = None
+        if cdx_cache_ttl > 0 or cdx_cache_only:
+            self.cdx_cache = CdxCache(
+                self.output_dir / STATE_DIR / "cdx",
+                ttl=cdx_cache_ttl,
+                offline=cdx_cache_only,
+            )
+        # URLs that were missing from the archive in an earlier run are
+        # not requested again for miss_cache_ttl seconds (<= 0 disables)
+        self.misses: Optional[MissCache] = None
+        if miss_cache_ttl > 0:
+            self.misses = MissCache(
+                self.output_dir / STATE_DIR / "misses.json", miss_cache_ttl
+            )
+        # Payloads shared by several URLs are fetched once per CDX digest
+        self.blob_store: Optional[BlobStore] = None
+        if dedup:
+            self.blob_store = BlobStore(self.output_dir / STATE_DIR / "blobs")
+        # Raw id_ responses are also recorded as WARC files, if requested
+        self.warc: Optional[WarcWriter] = None
+        if warc_dir:
+            self.warc = WarcWriter(Path(warc_dir), domain, warc_max_size)
+        self.wacz = wacz
         self.stats = HarvestStats()
+        # Phase/activity timing and request histograms (manifest.json),
+        # optionally streamed as trace events to ``trace_path``
+        self.metrics = HarvestMetrics(Path(trace_path) if trace_path else None)
         # url_map: normalized original URL -> CdxEntry
         self.url_map: dict[str, CdxEntry] = {}
         # local_map: normalized original URL -> local Path (relative to output_dir)
         self.local_map: dict[str, Path] = {}
+        # Other spellings of local_map keys (index.html, ...) -> key,
+        # extended lazily as local_map grows (see _find_local_file)
+        self._aliases: dict[str, str] = {}
+        self._aliased = 0
+        # (ref, base URL) -> internal normalized URL or None
+        self._resolve_internal = lru_cache(maxsize=RESOLVE_CACHE_SIZE)(
+            self._resolve_internal_uncached
+        )
         # track which URLs we've already downloaded (for asset rounds)
         self.downloaded_urls: set[str] = set()
+        # links: local Path <-> internal URLs it references, kept per file
+        # so later discovery rounds and rewriting need not re-parse
+        self.links = LinkGraph()
+        # local Path -> external http(s) links (<a href>) found in it
+        self.external_links: dict[Path, list[str]] = {}
+        # LRU of local Path -> (soup, refs) from the discovery parse,
+        # handed on to the rewriter instead of parsing the file again
+        self._parse_cache: OrderedDict = OrderedDict()
+        # Background thread parsing payloads on arrival and rewriting
+        # settled files while downloads go on (see _pipeline_start)
+        self._pipeline: Optional[ThreadPoolExecutor] = None
+        self._pipeline_tasks: list = []
+        self._pipeline_slots = threading.BoundedSemaphore(PIPELINE_MAX_PENDING)
+        self._early_rewrite = False
+        # Parsed files not yet rewritten: local Path -> the normalized URL
+        # it was downloaded for
+        self._unsettled: dict[Path, str] = {}
+        # harvested: normalized URL -> capture record persisted in the
+        # state file; prior_state holds the previous run's records
+        self.state_path = self.output_dir / STATE_DIR / "state.json"
+        self.harvested: dict[str, dict] = {}
+        self.prior_state: dict[str, dict] = {}
+        # local Paths written from the archive during this run
+        self.fresh_files: set[Path] = set()
+        # Append-only record of finished downloads and failures; --resume
+        # replays it (into journaled) instead of checking files on disk
+        self.journal = DownloadJournal(self.output_dir / STATE_DIR / "journal.jsonl")
+        self.journaled: Optional[dict[str, dict]] = None
+        self._journaled_paths: set[str] = set()
+        # local Path -> normalized URLs its links were already rewritten
+        # for, ahead of Phase 4 or by a run being resumed (see load_journal)
+        self.rewritten_files: dict[Path, set[str]] = {}
+        # local_map as of the last completed rewrite, and files a previous
+        # --skip-rewrite run left unrewritten (both from the state file)
+        self.rewritten_map: dict[str, str] = {}
+        self.pending_rewrite: set[Path] = set()
 
     # ------------------------------------------------------------------
     # Phase 1: CDX Discovery
     # ------------------------------------------------------------------
 
-    def _query_cdx_domain(self, url_pattern: str) -> list[CdxEntry]:
-        """Query CDX API for a single URL pattern, returning all entries."""
+    def _fetch_cdx_rows(
+        self, params: dict, timeout: int = 120, pause: bool = False
+    ) -> Optional[Iterator[list]]:
+        """Run one CDX query; return an iterator over its JSON rows, or None
+        on failure.
+
+        Rows are parsed as the response streams in, so a large listing is
+        never held in memory whole.  Answers from the CDX cache when
+        possible.  ``pause`` applies the politeness delay after a real
+        network request.
+        """
+        if self.cdx_cache is not None:
+            rows = self.cdx_cache.get(params)
+            if rows is not None:
+                logger.debug("  CDX cache hit for %s", params.get("url"))
+                return rows
+            if self.cdx_cache.offline:
+                logger.error("CDX cache miss for %s (--cdx-cache-only)", params.get("url"))
+                return None
+        resp = self._get_with_retry(
+            WAYBACK_CDX, params=params, timeout=timeout, stream=True
+        )
+        if pause:
+            self._pause()
+        if resp is None or resp.status_code != 200:
+            if resp is not None:
+                resp.close()
+            logger.error("CDX query failed for %s", params.get("url"))
+            return None
+        return self._stream_cdx_rows(resp, params)
+
+    def _stream_cdx_rows(self, resp: requests.Response, params: dict) -> Iterator[list]:
+        """Yield rows from a streamed CDX response, caching them on the way.
+
+        The cache entry is only kept if the whole response parsed.  A
+        truncated or malformed response is logged and its error
+        (one of CDX_STREAM_ERRORS) raised, so callers can treat the query
+        as failed rather than use a partial listing.
+        """
+        store_rows = (
+            self.cdx_cache.put(params) if self.cdx_cache is not None
+            else nullcontext(None)
+        )
+        received = 0
+
+        def counted(lines):
+            nonlocal received
+            for line in lines:
+                received += len(line) + 1
+                yield line
+
+        try:
+            with resp, store_rows as store:
+                for row in parse_cdx_lines(counted(resp.iter_lines())):
+                    if store is not None:
+                        store(row)
+                    yield row
+        except ValueError:
+            logger.error("CDX returned non-JSON for %s", params.get("url"))
+            raise
+        except requests.RequestException as exc:
+            logger.error("CDX response for %s interrupted: %s", params.get("url"), exc)
+            raise
+        finally:
+            self.metrics.size("cdx", resp.status_code, received)
+
+    @staticmethod
+    def _rows_to_entries(rows: Iterable[list]) -> Iterator[CdxEntry]:
+        """Convert CDX JSON rows (header row first) to CdxEntry objects."""
+        rows = iter(rows)
+        next(rows, None)  # skip header row
+        for row in rows:
+            if len(row) >= 7:
+                yield CdxEntry.from_row(row)
+
+    def _query_cdx_domain(self, url_pattern: str) -> Iterator[CdxEntry]:
+        """Query CDX API for a single URL pattern, yielding entries as they
+        are read."""
         # Note: we do NOT use closest/sort=closest here because combining
         # those with collapse=urlkey causes the CDX API to hang on large
         # domains.  Instead we fetch all entries (collapsed to one per urlkey)
         # and pick the best timestamp in Python via deduplicate_urls().
+        # Collapsing is per page, so the odd duplicate across a page
+        # boundary is left to deduplicate_urls() too.
         params = {
             "url": url_pattern,
             "output": "json",
-            "fl": "urlkey,timestamp,original,mimetype,statuscode,digest,length",
+            "fl": CDX_FIELDS,
             "filter": "statuscode:200",
             "collapse": "urlkey",
-            "limit": "100000",
         }
-        resp = self._get_with_retry(WAYBACK_CDX, params=params, timeout=300)
-        if resp is None or resp.status_code != 200:
-            logger.error("CDX query failed for %s", url_pattern)
-            return []
+        pages = self._cdx_page_count(params)
+        count = 0
+        if pages and pages > 1:
+            logger.info("  CDX %s: %d pages", url_pattern, pages)
+            entries = self._query_cdx_pages(params, pages)
+        else:
+            rows = self._fetch_cdx_rows(
+                {**params, "limit": str(CDX_DOMAIN_LIMIT)}, timeout=300
+            )
+            entries = self._rows_to_entries(rows) if rows is not None else iter(())
         try:
-            rows = resp.json()
-        except json.JSONDecodeError:
-            logger.error("CDX returned non-JSON for %s", url_pattern)
-            return []
-        if not rows or len(rows) <= 1:
-            return []
-        entries = []
-        for row in rows[1:]:  # skip header row
-            if len(row) >= 7:
-                entries.append(CdxEntry(*row[:7]))
-        logger.info("  CDX %s: %d entries", url_pattern, len(entries))
-        return entries
+            for entry in entries:
+                count += 1
+                yield entry
+        except CDX_STREAM_ERRORS:
+            # The listing is incomplete: keep what arrived, but say so
+            self._record_cdx_failure(url_pattern)
+        logger.info("  CDX %s: %d entries", url_pattern, count)
+        if (not pages or pages <= 1) and count >= CDX_DOMAIN_LIMIT:
+            logger.warning(
+                "  CDX %s hit the %d-row limit; the listing may be truncated",
+                url_pattern, CDX_DOMAIN_LIMIT,
+            )
 
-    def query_cdx(self) -> list[CdxEntry]:
-        """Query the CDX API for all captures of the domain."""
+    def _cdx_page_count(self, params: dict) -> Optional[int]:
+        """Number of result pages for a query, or None if the server does
+        not support pagination."""
+        params = {**params, "showNumPages": "true"}
+        if self.cdx_cache is not None:
+            rows = self.cdx_cache.get(params)
+            if rows is not None:
+                cached = list(rows)
+                return cached[0][0] if cached else None
+            if self.cdx_cache.offline:
+                return None
+        # Servers without pagination answer the probe with 400
+        resp = self._get_with_retry(
+            WAYBACK_CDX, params=params, timeout=CDX_PAGE_TIMEOUT, expect=(400,)
+        )
+        if resp is None:
+            return None
+        if resp.status_code != 200:
+            logger.debug("  CDX pagination unavailable (HTTP %d)", resp.status_code)
+            return None
+        text = resp.text.strip()
+        try:
+            # Plain "12" from the Wayback server, {"pages": 12} from pywb
+            value = json.loads(text)
+            pages = int(value["pages"] if isinstance(value, dict) else value)
+        except (ValueError, TypeError, KeyError):
+            logger.debug("  CDX pagination unavailable: %r", text[:80])
+            return None
+        if self.cdx_cache is not None:
+            with self.cdx_cache.put(params) as store:
+                store([pages])
+        return pages
+
+    def _query_cdx_pages(self, params: dict, pages: int) -> Iterator[CdxEntry]:
+        """Fetch every page of a CDX query, yielding entries as they arrive.
+
+        Up to --workers pages stream at once, each request going through
+        the shared rate limiter; their entries are merged through a small
+        bounded queue, so memory does not grow with the page count.  A
+        page that fails, or is cut off mid-stream, is logged and recorded
+        as a failure; the entries it did deliver are kept.
+        """
+        merged: queue.Queue = queue.Queue(maxsize=CDX_MERGE_QUEUE)
+        stop = threading.Event()
+        done = object()
+        errors: list[BaseException] = []
+
+        def offer(item) -> bool:
+            while not stop.is_set():
+                try:
+                    merged.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def fetch(page: int) -> None:
+            try:
+                if stop.is_set():
+                    return
+                rows = self._fetch_cdx_rows(
+                    {**params, "page": str(page)}, timeout=CDX_PAGE_TIMEOUT,
+                    pause=True,
+                )
+                if rows is None:
+                    self._record_cdx_failure(f"{params['url']} page {page}")
+                    return
+                entries = self._rows_to_entries(rows)
+                try:
+                    while batch := list(islice(entries, CDX_MERGE_BATCH)):
+                        if not offer(batch):
+                            return
+                except CDX_STREAM_ERRORS:
+                    # Cut off mid-stream: as much a failed page as no answer
+                    self._record_cdx_failure(f"{params['url']} page {page}")
+            except BaseException as exc:
+                errors.append(exc)
+            finally:
+                offer(done)
+
+        pool = thread_pool(min(self.workers, pages))
+        try:
+            for page in range(pages):
+                pool.submit(fetch, page)
+            remaining = pages
+            while remaining:
+                item = merged.get()
+                if item is done:
+                    remaining -= 1
+                    if errors:
+                        raise errors[0]
+                else:
+                    yield from item
+        finally:
+            stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def _record_cdx_failure(self, label: str) -> None:
+        with self._lock:
+            self.stats.failures.append({"url": label, "phase": "cdx"})
+
+    def query_cdx(self) -> Iterator[CdxEntry]:
+        """Query the CDX API for all captures of the domain.
+
+        A generator: feed it straight to deduplicate_urls() so only one
+        entry per unique URL is ever kept.  stats.cdx_total is complete
+        once it is exhausted.
+        """
         logger.info("Querying CDX API for %s ...", self.domain)
-        all_entries: list[CdxEntry] = []
+        self.stats.cdx_total = 0
 
         # The CDX urlkey normalizes www.usgin.org to org,usgin) so both
         # bare and www URLs are returned by the single bare-domain query.
         # Skipping the separate www query avoids intermittent CDX timeouts.
-        all_entries.extend(self._query_cdx_domain(f"{self.domain}/*"))
+        for entry in self._query_cdx_domain(f"{self.domain}/*"):
+            self.stats.cdx_total += 1
+            yield entry
 
-        self.stats.cdx_total = len(all_entries)
-        logger.info("CDX total entries (before dedup): %d", len(all_entries))
-        return all_entries
+        logger.info("CDX total entries (before dedup): %d", self.stats.cdx_total)
 
     def normalize_url(self, url: str) -> str:
         """Normalize a URL for deduplication."""
@@ -210,18 +1897,17 @@ class WaybackHarvester:
         netloc = host if port is None else f"{host}:{port}"
         return urlunparse((scheme, netloc, path, "", "", ""))
 
-    def deduplicate_urls(self, entries: list[CdxEntry]) -> dict[str, CdxEntry]:
+    def deduplicate_urls(self, entries: Iterable[CdxEntry]) -> dict[str, CdxEntry]:
         """Keep one entry per normalized URL, preferring closest timestamp."""
         url_map: dict[str, CdxEntry] = {}
-        target = int(self.target_timestamp)
+        # A short target such as 20250612 means the start of that day
+        target = int(self.target_timestamp.ljust(14, "0")[:14])
         for entry in entries:
             norm = self.normalize_url(entry.original)
-            if norm in url_map:
-                existing_dist = abs(int(url_map[norm].timestamp) - target)
-                new_dist = abs(int(entry.timestamp) - target)
-                if new_dist < existing_dist:
-                    url_map[norm] = entry
-            else:
+            existing = url_map.get(norm)
+            if existing is None or (
+                abs(entry.timestamp - target) < abs(existing.timestamp - target)
+            ):
                 url_map[norm] = entry
         return url_map
 
@@ -230,19 +1916,149 @@ class WaybackHarvester:
         filtered = {}
         for norm_url, entry in url_map.items():
             path = urlparse(norm_url).path
-            full = entry.original
-            skip = False
-            for pattern in EXCLUDED_PATTERNS:
-                if pattern.search(path) or pattern.search(full):
-                    skip = True
-                    break
-            if not skip:
+            if not (EXCLUDED_RE.search(path) or EXCLUDED_RE.search(entry.original)):
                 filtered[norm_url] = entry
         removed = len(url_map) - len(filtered)
         if removed:
             logger.info("Filtered out %d excluded URLs", removed)
         return filtered
 
+    def _preference(self, local_path: Path) -> int:
+        """Rank of a file in the --prefer order (unlisted extensions last)."""
+        try:
+            return self.prefer.index(local_path.suffix.lower())
+        except ValueError:
+            return len(self.prefer)
+
+    def _reserve(self, nbytes: Optional[int]) -> bool:
+        """Charge one download of ``nbytes`` to the budgets, if it fits.
+
+        A download of unknown size (None) is charged the mean of those
+        reserved so far.
+        """
+        with self._lock:
+            if nbytes is None:
+                nbytes = self._budget_bytes // max(1, self._budget_requests)
+            if (self.max_requests is not None
+                    and self._budget_requests + 1 > self.max_requests):
+                return False
+            if (self.max_bytes is not None
+                    and self._budget_bytes + nbytes > self.max_bytes):
+                return False
+            self._budget_requests += 1
+            self._budget_bytes += nbytes
+            return True
+
+    def _budget_spent(self) -> bool:
+        """True once --max-requests is used up, or --max-bytes is."""
+        return (
+            self.max_requests is not None and self._budget_requests >= self.max_requests
+            or self.max_bytes is not None and self._budget_bytes >= self.max_bytes
+        )
+
+    def plan_downloads(
+        self, url_map: dict[str, CdxEntry], resume: bool = False,
+    ) -> dict[str, CdxEntry]:
+        """Estimate the download phase from the CDX rows and apply budgets.
+
+        Counts the id_ requests needed (URLs kept by --resume, unchanged
+        for --incremental or known to be missing cost none), their
+        CDX-listed bytes by extension and mimetype, and an ETA at the
+        configured rate; the result is kept in ``self.plan``.  With
+        --max-bytes/--max-requests, URLs are taken in --prefer order while
+        they fit, and the rest are dropped, for asset discovery as well.
+        Returns the URLs to harvest, in download order.
+        """
+        items = [
+            (norm_url, entry, self.url_to_local_path(entry.original))
+            for norm_url, entry in url_map.items()
+        ]
+        if self.prefer is not None:
+            items.sort(key=lambda item: self._preference(item[2]))
+        kept: dict[str, CdxEntry] = {}
+        skipped: dict[str, int] = defaultdict(int)
+        by_extension: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+        by_mimetype: dict[str, list[int]] = defaultdict(lambda: [0, 0])
+        for norm_url, entry, local_path in items:
+            if resume and self._resumable(norm_url, local_path):
+                skipped["resume"] += 1
+            elif self.prior_state and self._is_unchanged(norm_url, entry.digest, local_path):
+                skipped["unchanged"] += 1
+            elif self.misses is not None and self.misses.reason(
+                    norm_url, str(entry.timestamp)):
+                skipped["known_missing"] += 1
+            elif not self._reserve(entry.length):
+                skipped["over_budget"] += 1
+                self._over_budget.add(norm_url)
+                continue
+            else:
+                for counts, key in (
+                    (by_extension, local_path.suffix.lower() or "(none)"),
+                    (by_mimetype, entry.mimetype),
+                ):
+                    counts[key][0] += 1
+                    counts[key][1] += entry.length
+            kept[norm_url] = entry
+
+        if self.rate_limiter is not None:
+            rate = self.rate_limiter.rate
+        elif self.delay > 0:
+            rate = 1.0 / self.delay
+        else:
+            rate = None
+        requests_needed = self._budget_requests
+        self.plan = {
+            "urls": len(url_map),
+            "requests": requests_needed,
+            "bytes": self._budget_bytes,
+            "skipped": dict(skipped),
+            "by_extension": {k: {"count": n, "bytes": b} for k, (n, b) in sorted(by_extension.items())},
+            "by_mimetype": {k: {"count": n, "bytes": b} for k, (n, b) in sorted(by_mimetype.items())},
+            "rate": rate,
+            "eta_seconds": round(requests_needed / rate) if rate else None,
+            "max_bytes": self.max_bytes,
+            "max_requests": self.max_requests,
+        }
+        self.stats.over_budget += skipped["over_budget"]
+        logger.info(
+            "Plan: %d downloads, %s bytes listed%s",
+            requests_needed, f"{self._budget_bytes:,}",
+            f", at least {format_duration(requests_needed / rate)} at "
+            f"{rate:g} req/s" if rate else "",
+        )
+        if skipped["over_budget"]:
+            logger.warning(
+                "Budget: skipping %d URLs (--max-bytes/--max-requests)",
+                skipped["over_budget"],
+            )
+        return kept
+
+    def print_plan(self) -> None:
+        """Print the estimate from plan_downloads() (--plan)."""
+        plan = self.plan
+        print("\n" + "=" * 60)
+        print("HARVEST PLAN")
+        print("=" * 60)
+        print(f"  URLs after dedup/filter: {plan['urls']}")
+        print(f"  Downloads:               {plan['requests']}")
+        print(f"  Bytes (CDX lengths):     {plan['bytes']:,}")
+        for reason, count in sorted(plan["skipped"].items()):
+            print(f"  Skipped ({reason}):{' ' * max(1, 15 - len(reason))}{count}")
+        for title, key in (("extension", "by_extension"), ("mimetype", "by_mimetype")):
+            print(f"\n  By {title}:")
+            rows = sorted(plan[key].items(), key=lambda kv: -kv[1]["bytes"])
+            for name, counts in rows:
+                print(f"    {name[:28]:28s} {counts['count']:7d} {counts['bytes']:>16,}")
+        if plan["rate"]:
+            print(
+                f"\n  Estimated time:          at least "
+                f"{format_duration(plan['eta_seconds'])} at {plan['rate']:g} req/s"
+            )
+        else:
+            print("\n  Estimated time:          unknown (no --delay or --rate)")
+        print("  (asset discovery adds requests that cannot be listed up front)")
+        print("=" * 60)
+
     # ------------------------------------------------------------------
     # Phase 2: Download
     # ------------------------------------------------------------------
@@ -281,100 +2097,439 @@ class WaybackHarvester:
         """Build the id_ Wayback URL for clean content (no toolbar)."""
         return f"{WAYBACK_WEB}/{timestamp}id_/{original_url}"
 
+    @staticmethod
+    def _retry_after(resp: requests.Response) -> Optional[float]:
+        """Seconds requested by a Retry-After header, if any (capped)."""
+        value = resp.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            seconds = float(value)
+        except ValueError:
+            try:
+                when = parsedate_to_datetime(value)
+            except (TypeError, ValueError):
+                return None
+            seconds = when.timestamp() - time.time()
+        return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+    def _backoff(
+        self, attempt: int, reason: str, retry_after: Optional[float] = None
+    ) -> None:
+        """Slow down after a throttling response or connection error.
+
+        The adaptive limiter cuts the shared rate (and honours Retry-After)
+        instead of sleeping here; otherwise sleep with exponential backoff.
+        """
+        limiter = self.rate_limiter
+        if isinstance(limiter, AdaptiveRateLimiter):
+            limiter.throttled(retry_after)
+            logger.warning(
+                "  %s — retrying at %.2f req/s", reason, limiter.rate
+            )
+            return
+        wait = max((2 ** attempt) + 1, retry_after or 0)
+        logger.warning("  %s — retrying in %ds", reason, wait)
+        with self.metrics.span("sleep", "backoff"):
+            time.sleep(wait)
+
+    def _healthy(self) -> None:
+        """Let the adaptive limiter speed up after a non-throttled answer."""
+        if isinstance(self.rate_limiter, AdaptiveRateLimiter):
+            self.rate_limiter.succeeded()
+
     def _get_with_retry(
         self, url: str, params: dict = None, stream: bool = False,
-        timeout: int = 120,
+        timeout: int = 120, missing_ok: bool = False, expect: tuple = (),
     ) -> Optional[requests.Response]:
-        """HTTP GET with exponential backoff on transient errors."""
+        """HTTP GET with backoff on transient errors.
+
+        Returns None on failure; with ``missing_ok``, a 404/410 response is
+        returned instead so the caller can tell a miss from an error, and
+        so is a response with any status in ``expect``.
+        """
         for attempt in range(self.max_retries):
-            try:
-                resp = self.session.get(
-                    url, params=params, stream=stream, timeout=timeout
+            resp = self._get_attempt(
+                url, attempt, params, stream, timeout, missing_ok, expect
+            )
+            if resp is not RETRY:
+                return resp
+        logger.error("  Giving up on %s after %d attempts", url[:120], self.max_retries)
+        return None
+
+    def _get_attempt(
+        self, url: str, attempt: int, params: dict = None, stream: bool = False,
+        timeout: int = 120, missing_ok: bool = False, expect: tuple = (),
+    ):
+        """One try of _get_with_retry(): its result, or RETRY once the
+        backoff after a transient error is over."""
+        kind = "cdx" if url.startswith(WAYBACK_CDX) else "content"
+        if self.rate_limiter is not None:
+            with self.metrics.span("sleep", "rate_limit"):
+                self.rate_limiter.acquire()
+        start = time.perf_counter()
+        try:
+            resp = self.session.get(
+                url, params=params, stream=stream, timeout=timeout
+            )
+            self.metrics.request(
+                kind, resp.status_code, start,
+                time.perf_counter() - start, url,
+            )
+            if not stream:
+                self.metrics.size(kind, resp.status_code, len(resp.content))
+            if resp.status_code == 200:
+                self._healthy()
+                return resp
+            if resp.status_code in RETRY_STATUSES:
+                resp.close()
+                self.metrics.retry(kind, str(resp.status_code))
+                self._backoff(
+                    attempt,
+                    f"HTTP {resp.status_code} for {url[:120]}",
+                    self._retry_after(resp),
                 )
-                if resp.status_code == 200:
-                    return resp
-                if resp.status_code in (429, 503, 504, 520, 521, 522, 523, 524):
-                    wait = (2 ** attempt) + 1
-                    logger.warning(
-                        "  HTTP %d for %s — retrying in %ds",
-                        resp.status_code, url[:120], wait,
+                return RETRY
+            self._healthy()
+            if missing_ok and resp.status_code in (404, 410) or resp.status_code in expect:
+                return resp
+            if resp.status_code == 404:
+                logger.debug("  404: %s", url[:120])
+                return None
+            logger.warning(
+                "  HTTP %d for %s", resp.status_code, url[:120]
+            )
+            return None
+        except (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ReadTimeout,
+            requests.exceptions.ChunkedEncodingError,
+        ) as exc:
+            self.metrics.request(
+                kind, "error", start, time.perf_counter() - start, url
+            )
+            self.metrics.retry(kind, "connection")
+            self._backoff(
+                attempt, f"Connection error for {url[:120]}: {exc}"
+            )
+            return RETRY
+
+    def download_url(
+        self, original_url: str, timestamp: str, local_path: Path,
+        digest: Optional[str] = None,
+    ) -> Optional[int]:
+        """Download a single URL from the Wayback Machine to ``local_path``.
+
+        ``digest`` is the CDX digest of the capture, if known.  With the
+        blob store enabled, a payload already stored under that digest is
+        linked into place without a request.  Returns the number of bytes
+        written, or None.
+        """
+        store = self.blob_store
+        if store is None or not digest:
+            return self._fetch_to_file(original_url, timestamp, local_path, digest)
+        with store.lock(digest):
+            if store.has(digest):
+                size = store.link_to(digest, self.output_dir / local_path)
+                self._record_saved(local_path, size)
+                with self._lock:
+                    self.stats.deduplicated += 1
+                logger.debug("  %s linked from blob %s", local_path, digest)
+                return size
+            return self._fetch_to_file(original_url, timestamp, local_path, digest)
+
+    def _fetch_to_file(
+        self, original_url: str, timestamp: str, local_path: Path,
+        digest: Optional[str],
+    ) -> Optional[int]:
+        """Stream a capture to disk and check it against its CDX digest.
+
+        The body is written in chunks to a temp file that is renamed into
+        place only once complete, so peak memory is independent of the
+        asset size.
+        """
+        wb_url = self.wayback_url(original_url, timestamp)
+        full_path = self.output_dir / local_path
+        # One loop for request and transfer errors alike, so a flaky
+        # capture costs at most max_retries requests
+        for attempt in range(self.max_retries):
+            resp = self._get_attempt(wb_url, attempt, stream=True, missing_ok=True)
+            if resp is RETRY:
+                continue
+            if resp is None:
+                return None
+            if resp.status_code != 200:
+                resp.close()
+                logger.debug("  %d: %s", resp.status_code, wb_url[:120])
+                if self.misses is not None:
+                    # Without a CDX digest there was no listed capture
+                    self.misses.add(
+                        self.normalize_url(original_url),
+                        "not_found" if digest else "no_capture",
+                        timestamp if digest else None,
                     )
-                    time.sleep(wait)
-                    continue
-                if resp.status_code == 404:
-                    logger.debug("  404: %s", url[:120])
-                    return None
-                logger.warning(
-                    "  HTTP %d for %s", resp.status_code, url[:120]
-                )
                 return None
+            chunks = resp.iter_content(DOWNLOAD_CHUNK_SIZE)
+            kept: Optional[bytearray] = None
+            if self._pipeline is not None and local_path.suffix.lower() in (
+                ".html", ".htm", ".css"
+            ):
+                kept = bytearray()
+                chunks = tee_chunks(chunks, kept, PIPELINE_PAYLOAD_MAX)
+            try:
+                with resp, self.metrics.span("network", "transfer"):
+                    size, sha1 = atomic_write(full_path, chunks)
             except (
                 requests.ConnectionError,
                 requests.Timeout,
-                requests.exceptions.ReadTimeout,
                 requests.exceptions.ChunkedEncodingError,
             ) as exc:
-                wait = (2 ** attempt) + 1
+                self.metrics.retry("content", "transfer")
+                self._backoff(
+                    attempt, f"Transfer of {wb_url[:120]} interrupted: {exc}"
+                )
+                continue
+            self.metrics.size("content", 200, size)
+            self._record_saved(local_path, size)
+            actual = cdx_digest(sha1)
+            if digest and actual != digest:
+                with self._lock:
+                    self.stats.digest_mismatches += 1
                 logger.warning(
-                    "  Connection error for %s: %s — retrying in %ds",
-                    url[:120], exc, wait,
+                    "  Digest mismatch for %s: CDX %s, got %s",
+                    original_url[:120], digest, actual,
                 )
-                time.sleep(wait)
-        logger.error("  Giving up on %s after %d attempts", url[:120], self.max_retries)
+            if self.blob_store is not None:
+                # Under the key download_url() looks up (and locks): the
+                # CDX digest, even if the payload did not match it
+                self.blob_store.add(digest or actual, full_path)
+            if self.warc is not None:
+                # Record the capture Wayback actually served (after any
+                # redirect to the nearest timestamp)
+                served = WAYBACK_TIMESTAMP_RE.search(resp.url)
+                self.warc.write_response(
+                    original_url, served.group(1) if served else timestamp,
+                    resp, full_path, size, sha1,
+                )
+            if kept is not None and len(kept) == size:
+                self._submit_parse(
+                    self.normalize_url(original_url), local_path, bytes(kept)
+                )
+            return size
+        logger.error("  Giving up on %s after %d attempts", wb_url[:120], self.max_retries)
         return None
 
-    def download_url(self, original_url: str, timestamp: str) -> Optional[bytes]:
-        """Download a single URL from the Wayback Machine."""
-        wb_url = self.wayback_url(original_url, timestamp)
-        resp = self._get_with_retry(wb_url)
-        if resp is None:
-            return None
-        return resp.content
-
-    def save_file(self, content: bytes, local_path: Path) -> None:
-        """Write content to disk, creating directories as needed."""
-        full_path = self.output_dir / local_path
-        full_path.parent.mkdir(parents=True, exist_ok=True)
-        full_path.write_bytes(content)
-        size = len(content)
-        self.stats.bytes_total += size
+    def _record_saved(self, local_path: Path, size: int) -> None:
+        """Add a newly written file to the byte and extension counts."""
         ext = local_path.suffix.lower() or "(none)"
-        self.stats.by_extension[ext] += 1
+        with self._lock:
+            self.stats.bytes_total += size
+            self.stats.by_extension[ext] += 1
+            self.fresh_files.add(local_path)
+            # The file changed, so any earlier parse of it is stale
+            self.links.discard(local_path)
+            self.external_links.pop(local_path, None)
+            self._parse_cache.pop(local_path, None)
+            self.rewritten_files.pop(local_path, None)
 
-    def download_all_cdx(self, resume: bool = False) -> None:
-        """Download all URLs from the CDX results."""
-        total = len(self.url_map)
-        logger.info("Downloading %d URLs ...", total)
-        for i, (norm_url, entry) in enumerate(self.url_map.items(), 1):
-            local_path = self.url_to_local_path(entry.original)
-            self.local_map[norm_url] = local_path
+    def _pause(self) -> None:
+        """Serial-mode politeness delay (concurrent mode uses the bucket)."""
+        if self.delay > 0 and self.rate_limiter is None:
+            with self.metrics.span("sleep", "delay"):
+                time.sleep(self.delay)
+
+    def _map_jobs(self, func, items: list) -> list:
+        """Call a module-level job function on every item in --jobs processes.
+
+        Each process holds a read-only copy of the URL maps taken now;
+        its stats and activity times are merged back here.
+        """
+        config = {
+            "domain": self.domain,
+            "timestamp": self.target_timestamp,
+            "output_dir": str(self.output_dir),
+            "cdx_cache_ttl": 0,
+            "miss_cache_ttl": 0,
+            "parser": self.parser,
+            "rewrite_mode": self.rewrite_mode,
+        }
+        snapshot = {
+            "url_map": self.url_map,
+            "local_map": self.local_map,
+            "downloaded_urls": self.downloaded_urls,
+        }
+        chunksize = max(1, len(items) // (self.jobs * 8))
+        with ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=_init_job_worker,
+            initargs=(config, snapshot, self.journal.is_open),
+        ) as pool:
+            results = list(pool.map(func, items, chunksize=chunksize))
+        values = []
+        with self._lock:
+            for value, counts, seconds in results:
+                values.append(value)
+                self.stats.rewritten_html += counts["rewritten_html"]
+                self.stats.rewritten_css += counts["rewritten_css"]
+                with self.metrics.lock:
+                    for name, spent in seconds.items():
+                        self.metrics.seconds[name] += spent
+        return values
+
+    def _map_workers(self, func, items: list) -> None:
+        """Call ``func`` on every item, on a thread pool if --workers > 1."""
+        if self.workers <= 1:
+            for item in items:
+                func(item)
+            return
+        with thread_pool(self.workers) as pool:
+            # list() re-raises the first worker exception, if any
+            list(pool.map(func, items))
+
+    def _remember(
+        self, norm_url: str, original: str, timestamp: Optional[str],
+        digest: Optional[str], local_path: Path, size: Optional[int] = None,
+    ) -> None:
+        """Record the capture behind a local file for the state file and
+        the download journal."""
+        record = {
+            "original": original,
+            "timestamp": timestamp,
+            "digest": digest,
+            "path": local_path.as_posix(),
+        }
+        with self._lock:
+            self.harvested[norm_url] = record
+        if self.misses is not None:
+            self.misses.discard(norm_url)
+        # Files kept by --resume are in the journal already
+        if self._journaled_file(norm_url, local_path) is None:
+            self.journal.record({"url": norm_url, **record, "size": size})
 
+    def _record_failure(self, norm_url: str, original: str, phase: str) -> None:
+        """Note a failed download in the stats and the download journal."""
+        with self._lock:
+            self.stats.failures.append({"url": original, "phase": phase})
+        self.journal.record(
+            {"url": norm_url, "original": original, "phase": phase, "failed": True}
+        )
+
+    def _known_missing(
+        self, norm_url: str, original: str, phase: str,
+        timestamp: Optional[str] = None,
+    ) -> bool:
+        """True (and the failure recorded) if the miss cache says
+        ``norm_url`` is not in the archive, so no request is needed."""
+        if self.misses is None:
+            return False
+        reason = self.misses.reason(norm_url, timestamp)
+        if reason is None:
+            return False
+        with self._lock:
+            self.stats.known_missing += 1
+        self._record_failure(norm_url, original, phase)
+        logger.debug("  KNOWN MISSING (%s): %s", reason, norm_url)
+        return True
+
+    def _journaled_file(self, norm_url: str, local_path: Path) -> Optional[dict]:
+        """The journal's record of a completed download of ``norm_url`` to
+        ``local_path`` (from --resume), or None."""
+        record = (self.journaled or {}).get(norm_url)
+        if record and not record.get("failed") and record["path"] == local_path.as_posix():
+            return record
+        return None
+
+    def _resumable(self, norm_url: str, local_path: Path) -> bool:
+        """True if --resume can keep the file already at ``local_path``.
+
+        Answered from the download journal when there is one (the file
+        may have been journaled under another spelling of the URL, such
+        as an explicit index.html); older harvests without a journal fall
+        back to checking the file.
+        """
+        if self.journaled is None:
             full_path = self.output_dir / local_path
-            if resume and full_path.exists() and full_path.stat().st_size > 0:
+            return full_path.exists() and full_path.stat().st_size > 0
+        return local_path.as_posix() in self._journaled_paths
+
+    def _is_unchanged(self, norm_url: str, digest: str, local_path: Path) -> bool:
+        """True if the previous run stored this exact capture at local_path."""
+        prior = self.prior_state.get(norm_url)
+        if not prior or not digest or prior.get("digest") != digest:
+            return False
+        if prior.get("path") != local_path.as_posix():
+            return False
+        full_path = self.output_dir / local_path
+        return full_path.exists() and full_path.stat().st_size > 0
+
+    def _download_cdx_entry(
+        self, i: int, total: int, norm_url: str, entry: CdxEntry, resume: bool
+    ) -> None:
+        """Download one CDX URL (safe to call from a worker thread)."""
+        local_path = self.local_map[norm_url]
+        timestamp = str(entry.timestamp)
+        if self._is_unchanged(norm_url, entry.digest, local_path):
+            with self._lock:
+                self.stats.unchanged += 1
+                self.downloaded_urls.add(norm_url)
+                self.harvested[norm_url] = self.prior_state[norm_url]
+            self.journal.record({"url": norm_url, **self.prior_state[norm_url]})
+            if self.verbose:
+                logger.debug("  [%d/%d] UNCHANGED: %s", i, total, norm_url)
+            return
+        if resume and self._resumable(norm_url, local_path):
+            with self._lock:
                 self.stats.skipped_resume += 1
                 self.downloaded_urls.add(norm_url)
-                if self.verbose:
-                    logger.debug("  [%d/%d] SKIP (exists): %s", i, total, norm_url)
-                continue
+            self._remember(
+                norm_url, entry.original, timestamp, entry.digest, local_path
+            )
+            if self.verbose:
+                logger.debug("  [%d/%d] SKIP (exists): %s", i, total, norm_url)
+            return
 
-            content = self.download_url(entry.original, entry.timestamp)
-            if content is not None:
-                self.save_file(content, local_path)
+        if self._known_missing(norm_url, entry.original, "cdx_download", timestamp):
+            return
+        size = self.download_url(
+            entry.original, timestamp, local_path, entry.digest
+        )
+        if size is not None:
+            with self._lock:
                 self.downloaded_urls.add(norm_url)
                 self.stats.downloaded += 1
-                if self.verbose:
-                    logger.info(
-                        "  [%d/%d] %s -> %s (%d bytes)",
-                        i, total, norm_url, local_path, len(content),
-                    )
-            else:
-                self.stats.failures.append(
-                    {"url": entry.original, "phase": "cdx_download"}
+            self._remember(
+                norm_url, entry.original, timestamp, entry.digest, local_path, size
+            )
+            if self.verbose:
+                logger.info(
+                    "  [%d/%d] %s -> %s (%d bytes)",
+                    i, total, norm_url, local_path, size,
                 )
-                logger.warning("  [%d/%d] FAILED: %s", i, total, norm_url)
+        else:
+            self._record_failure(norm_url, entry.original, "cdx_download")
+            logger.warning("  [%d/%d] FAILED: %s", i, total, norm_url)
 
-            if self.delay > 0:
-                time.sleep(self.delay)
+        self._pause()
+
+    def download_all_cdx(self, resume: bool = False) -> None:
+        """Download all URLs from the CDX results."""
+        total = len(self.url_map)
+        if self.workers > 1:
+            logger.info("Downloading %d URLs with %d workers ...", total, self.workers)
+        else:
+            logger.info("Downloading %d URLs ...", total)
+        # Assign local paths up front so workers only read local_map
+        jobs = []
+        for i, (norm_url, entry) in enumerate(self.url_map.items(), 1):
+            self.local_map[norm_url] = self.url_to_local_path(entry.original)
+            jobs.append((i, norm_url, entry))
+        self._map_workers(
+            lambda job: self._download_cdx_entry(
+                job[0], total, job[1], job[2], resume
+            ),
+            jobs,
+        )
 
     # ------------------------------------------------------------------
     # Phase 3: Asset Discovery
@@ -386,15 +2541,24 @@ class WaybackHarvester:
             return None
         ref = ref.strip()
         # Skip non-HTTP refs
-        for pattern in EXCLUDED_PATTERNS:
-            if pattern.search(ref):
-                return None
+        if EXCLUDED_RE.search(ref):
+            return None
         # Resolve relative to base
         absolute = urljoin(base_url, ref)
         if not absolute.startswith(("http://", "https://")):
             return None
         return self.normalize_url(absolute)
 
+    def resolve_internal(self, ref: str, base_url: str) -> Optional[str]:
+        """resolve_url() restricted to this domain, memoized per (ref, base)."""
+        return self._resolve_internal(ref, base_url)
+
+    def _resolve_internal_uncached(self, ref: str, base_url: str) -> Optional[str]:
+        resolved = self.resolve_url(ref, base_url)
+        if resolved and self.is_internal(resolved):
+            return resolved
+        return None
+
     def is_internal(self, url: str) -> bool:
         """Check if a URL is internal to the target domain."""
         parsed = urlparse(url)
@@ -403,205 +2567,504 @@ class WaybackHarvester:
             host = host[4:]
         return host == self.domain
 
-    def parse_html(self, html_bytes: bytes, page_url: str) -> set[str]:
-        """Extract internal asset URLs from HTML."""
-        refs: set[str] = set()
-        try:
-            soup = BeautifulSoup(html_bytes, "html.parser")
-        except Exception:
-            return refs
-
-        # <link href="..."> (CSS, icons, etc.)
-        for tag in soup.find_all("link", href=True):
-            resolved = self.resolve_url(tag["href"], page_url)
-            if resolved and self.is_internal(resolved):
-                refs.add(resolved)
-
-        # <script src="...">
-        for tag in soup.find_all("script", src=True):
-            resolved = self.resolve_url(tag["src"], page_url)
-            if resolved and self.is_internal(resolved):
-                refs.add(resolved)
+    def extract_html_refs(self, soup: BeautifulSoup) -> list[HtmlRef]:
+        """Collect every URL-bearing attribute and CSS block in one tree walk."""
+        refs: list[HtmlRef] = []
+        for tag in soup.find_all(True):
+            attrs = tag.attrs
+            for attr in HTML_URL_ATTRS.get(tag.name, ()):
+                if attr in attrs:
+                    refs.append(HtmlRef(tag, attr, "url"))
+            if tag.name in SRCSET_TAGS and attrs.get("srcset"):
+                refs.append(HtmlRef(tag, "srcset", "srcset"))
+            if attrs.get("style"):
+                refs.append(HtmlRef(tag, "style", "css"))
+            if tag.name == "style" and tag.string:
+                refs.append(HtmlRef(tag, "", "css"))
+        return refs
 
-        # <img src="..."> and <img srcset="...">
-        for tag in soup.find_all("img"):
-            if tag.get("src"):
-                resolved = self.resolve_url(tag["src"], page_url)
-                if resolved and self.is_internal(resolved):
-                    refs.add(resolved)
-            if tag.get("srcset"):
-                for part in tag["srcset"].split(","):
-                    src = part.strip().split()[0] if part.strip() else ""
-                    resolved = self.resolve_url(src, page_url)
-                    if resolved and self.is_internal(resolved):
-                        refs.add(resolved)
+    def _resolve_html_refs(self, refs: list[HtmlRef], page_url: str) -> set[str]:
+        """Resolve extracted HTML references to internal normalized URLs."""
+        found: set[str] = set()
+        for ref in refs:
+            if ref.kind == "css":
+                text = ref.tag[ref.attr] if ref.attr else ref.tag.string
+                found.update(self._extract_css_refs(text, page_url))
+                continue
+            if ref.kind == "srcset":
+                values = [
+                    part.strip().split()[0]
+                    for part in ref.tag["srcset"].split(",") if part.strip()
+                ]
+            else:
+                values = [ref.tag[ref.attr]]
+            for value in values:
+                resolved = self.resolve_internal(value, page_url)
+                if resolved:
+                    found.add(resolved)
+        return found
 
-        # <a href="..."> (internal pages)
-        for tag in soup.find_all("a", href=True):
-            resolved = self.resolve_url(tag["href"], page_url)
-            if resolved and self.is_internal(resolved):
-                refs.add(resolved)
+    def _external_refs(self, refs: list[HtmlRef], page_url: str) -> list[str]:
+        """Absolute http(s) <a href> targets outside the domain, in order."""
+        found = []
+        for ref in refs:
+            if ref.tag.name != "a" or ref.attr != "href":
+                continue
+            href = ref.tag["href"].strip()
+            if not href or EXCLUDED_RE.search(href):
+                continue
+            absolute = urljoin(page_url, href)
+            if absolute.startswith(("http://", "https://")) and not self.is_internal(absolute):
+                found.append(absolute)
+        return found
 
-        # <source src="...">
-        for tag in soup.find_all("source", src=True):
-            resolved = self.resolve_url(tag["src"], page_url)
-            if resolved and self.is_internal(resolved):
-                refs.add(resolved)
+    def _parse_page(
+        self, local_path: Path, html_bytes: Optional[bytes] = None
+    ) -> tuple[BeautifulSoup, list[HtmlRef]]:
+        """Parse an HTML file, reusing the cached tree if there is one.
 
-        # <video> and <audio> with src
-        for tag_name in ("video", "audio"):
-            for tag in soup.find_all(tag_name, src=True):
-                resolved = self.resolve_url(tag["src"], page_url)
-                if resolved and self.is_internal(resolved):
-                    refs.add(resolved)
-
-        # Inline style with url()
-        for tag in soup.find_all(style=True):
-            refs.update(self._extract_css_urls(tag["style"], page_url))
-
-        # <style> blocks
-        for tag in soup.find_all("style"):
-            if tag.string:
-                refs.update(self._extract_css_urls(tag.string, page_url))
-
-        # @import in <style> blocks
-        for tag in soup.find_all("style"):
-            if tag.string:
-                for match in re.finditer(
-                    r'@import\s+(?:url\s*\(\s*)?["\']?([^"\')\s]+)',
-                    tag.string,
-                ):
-                    resolved = self.resolve_url(match.group(1), page_url)
-                    if resolved and self.is_internal(resolved):
-                        refs.add(resolved)
+        The file is read from disk only if it is not cached and
+        ``html_bytes`` is not given.
+        """
+        with self._lock:
+            cached = self._parse_cache.pop(local_path, None)
+        if cached is None:
+            if html_bytes is None:
+                html_bytes = (self.output_dir / local_path).read_bytes()
+            with self.metrics.span("parse", "html"):
+                soup = BeautifulSoup(html_bytes, self.parser)
+                cached = (soup, self.extract_html_refs(soup))
+        if self.rewrite_mode == "serialize":
+            # Only the serializing rewriter can reuse the tree
+            with self._lock:
+                self._parse_cache[local_path] = cached
+                while len(self._parse_cache) > PARSE_CACHE_SIZE:
+                    self._parse_cache.popitem(last=False)
+        return cached
 
-        return refs
+    def parse_html(self, html_bytes: bytes, page_url: str) -> set[str]:
+        """Extract internal asset URLs from HTML."""
+        try:
+            with self.metrics.span("parse", "html"):
+                soup = BeautifulSoup(html_bytes, self.parser)
+        except Exception:
+            return set()
+        return self._resolve_html_refs(self.extract_html_refs(soup), page_url)
 
-    def _extract_css_urls(self, css_text: str, base_url: str) -> set[str]:
-        """Extract url() references from CSS text."""
+    def _extract_css_refs(self, css_text: str, base_url: str) -> set[str]:
+        """Extract url() and @import references from CSS text."""
         refs: set[str] = set()
-        for match in re.finditer(r'url\s*\(\s*["\']?([^"\')\s]+)["\']?\s*\)', css_text):
-            ref = match.group(1)
+        for match in CSS_REF_RE.finditer(css_text):
+            ref = match.group("imp") or match.group("url")
             if ref.startswith("data:"):
                 continue
-            resolved = self.resolve_url(ref, base_url)
-            if resolved and self.is_internal(resolved):
+            resolved = self.resolve_internal(ref, base_url)
+            if resolved:
                 refs.add(resolved)
         return refs
 
     def parse_css(self, css_content: str, css_url: str) -> set[str]:
         """Extract internal asset URLs from CSS."""
-        refs: set[str] = set()
-        # url() references
-        refs.update(self._extract_css_urls(css_content, css_url))
-        # @import
-        for match in re.finditer(
-            r'@import\s+(?:url\s*\(\s*)?["\']?([^"\')\s;]+)', css_content
+        return self._extract_css_refs(css_content, css_url)
+
+    def _file_refs(
+        self, norm_url: str, local_path: Path, data: Optional[bytes] = None
+    ) -> Optional[set[str]]:
+        """Internal URLs referenced by a downloaded HTML or CSS file.
+
+        Each file is parsed once; the result is kept in the link graph.
+        ``data`` is the file's content if still in memory, else it is read
+        from disk.  Returns None for files that are neither HTML nor CSS.
+        """
+        known = self.links.get(local_path)
+        if known is not None:
+            return known
+        full_path = self.output_dir / local_path
+        suffix = local_path.suffix.lower()
+        # Reconstruct original URL for resolving relative refs
+        orig_url = self._norm_to_original(norm_url)
+        external = None
+        if suffix in (".html", ".htm") or (
+            suffix == "" and norm_url in self.downloaded_urls
         ):
-            resolved = self.resolve_url(match.group(1), css_url)
-            if resolved and self.is_internal(resolved):
-                refs.add(resolved)
-        return refs
+            try:
+                _, refs = self._parse_page(local_path, data)
+                found = self._resolve_html_refs(refs, orig_url)
+                external = self._external_refs(refs, orig_url)
+            except Exception as exc:
+                logger.debug("Error parsing HTML %s: %s", local_path, exc)
+                return None
+        elif suffix == ".css":
+            try:
+                if data is None:
+                    content = full_path.read_text(encoding="utf-8", errors="replace")
+                else:
+                    content = data.decode("utf-8", errors="replace")
+                with self.metrics.span("parse", "css"):
+                    found = self.parse_css(content, orig_url)
+            except Exception as exc:
+                logger.debug("Error parsing CSS %s: %s", local_path, exc)
+                return None
+        else:
+            return None
+        with self._lock:
+            self.links.record(local_path, found)
+            if external is not None:
+                self.external_links[local_path] = external
+        return found
 
-    def _find_best_timestamp(self, original_url: str) -> Optional[str]:
-        """Query CDX for a single URL to find its best timestamp."""
+    def _find_best_capture(self, original_url: str) -> Optional[CdxEntry]:
+        """Query CDX for a single URL to find its closest capture."""
         params = {
             "url": original_url,
             "output": "json",
-            "fl": "timestamp",
+            "fl": CDX_FIELDS,
             "filter": "statuscode:200",
             "closest": self.target_timestamp,
             "sort": "closest",
             "limit": "1",
         }
-        resp = self._get_with_retry(WAYBACK_CDX, params=params)
-        if resp and resp.status_code == 200:
+        rows = self._fetch_cdx_rows(params, pause=True)
+        if rows is None:
+            return None
+        try:
+            # Read to the end: the response is only cached once complete
+            entries = list(self._rows_to_entries(rows))
+        except CDX_STREAM_ERRORS:
+            return None
+        return entries[0] if entries else None
+
+    def _query_cdx_prefix(self, prefix: str) -> Optional[list[CdxEntry]]:
+        """Query CDX for every 200 capture under a URL prefix.
+
+        Not collapsed, so deduplicate_urls() can pick the capture closest
+        to the target timestamp.  Returns None if the query failed.
+        """
+        params = {
+            "url": prefix,
+            "matchType": "prefix",
+            "output": "json",
+            "fl": CDX_FIELDS,
+            "filter": "statuscode:200",
+            "limit": str(CDX_PREFIX_LIMIT),
+        }
+        rows = self._fetch_cdx_rows(params, pause=True)
+        if rows is None:
+            return None
+        try:
+            entries = list(self._rows_to_entries(rows))
+        except CDX_STREAM_ERRORS:
+            return None
+        logger.debug("  CDX prefix %s: %d entries", prefix, len(entries))
+        return entries
+
+    def _group_by_prefix(self, norm_urls: list[str]) -> dict[str, list[str]]:
+        """Group URLs under shared directories for prefix CDX queries.
+
+        Directories are taken deepest first: each one holding at least
+        CDX_BATCH_MIN_GROUP URLs not already in a deeper group becomes a
+        group of those URLs.  Nested groups are kept apart rather than
+        merged, so a broad directory such as /sites/ is only queried for
+        what its subdirectories leave over, and each prefix query stays
+        well under CDX_PREFIX_LIMIT.  URLs with no such directory below
+        the site root are returned under the "" key.
+        """
+        root = PurePosixPath("/")
+        under: dict[PurePosixPath, list[str]] = defaultdict(list)
+        for u in norm_urls:
+            d = PurePosixPath(urlparse(u).path).parent
+            for anc in (d, *d.parents):
+                if anc != root:
+                    under[anc].append(u)
+        groups: dict[str, list[str]] = {}
+        grouped: set[str] = set()
+        for anc in sorted(under, key=lambda p: (-len(p.parts), str(p))):
+            members = [u for u in under[anc] if u not in grouped]
+            if len(members) >= CDX_BATCH_MIN_GROUP:
+                groups[f"{self.domain}{anc}/"] = members
+                grouped.update(members)
+        rest = [u for u in norm_urls if u not in grouped]
+        if rest:
+            groups[""] = rest
+        return groups
+
+    def resolve_asset_captures(self, norm_urls: list[str]) -> dict[str, CdxEntry]:
+        """Find the best capture for many asset URLs at once.
+
+        URLs sharing a directory are resolved with one prefix CDX query,
+        picking the closest capture locally; singletons and URLs whose
+        prefix query failed or was truncated fall back to
+        _find_best_capture().  URLs with no 200 capture are omitted.
+        """
+        resolved: dict[str, CdxEntry] = {}
+        fallback: list[str] = []
+        for prefix, members in sorted(self._group_by_prefix(norm_urls).items()):
+            if not prefix:
+                fallback.extend(members)
+                continue
+            entries = self._query_cdx_prefix(prefix)
+            if entries is None:
+                fallback.extend(members)
+                continue
+            best = self.deduplicate_urls(entries)
+            truncated = len(entries) >= CDX_PREFIX_LIMIT
+            for norm_url in members:
+                if norm_url in best:
+                    resolved[norm_url] = best[norm_url]
+                elif truncated:
+                    fallback.append(norm_url)
+
+        for norm_url in fallback:
+            entry = self._find_best_capture(self._norm_to_original(norm_url))
+            if entry is not None:
+                resolved[norm_url] = entry
+        logger.info(
+            "  Resolved %d/%d asset captures (%d single-URL lookups)",
+            len(resolved), len(norm_urls), len(fallback),
+        )
+        return resolved
+
+    def _pipeline_start(self, rewrite: bool) -> None:
+        """Parse HTML/CSS payloads as they download, off the download path.
+
+        Each payload goes to a single background thread while still in
+        memory, so the parsing overlaps the network waits and discovery
+        waves find their files already scanned.  With ``rewrite``, files
+        whose link targets are all mapped are rewritten there too, during
+        the following downloads rather than in Phase 4.  Not used with
+        --jobs, which parses each wave in worker processes instead.
+        """
+        if self.jobs > 1:
+            return
+        self._pipeline = thread_pool(1, thread_name_prefix="pipeline")
+        self._early_rewrite = rewrite
+
+    def _pipeline_drain(self) -> None:
+        """Wait for everything handed to the pipeline thread so far."""
+        while True:
+            with self._lock:
+                tasks, self._pipeline_tasks = self._pipeline_tasks, []
+            if not tasks:
+                return
+            for future in tasks:
+                future.result()
+
+    def _pipeline_stop(self) -> None:
+        if self._pipeline is None:
+            return
+        try:
+            self._pipeline_drain()
+        finally:
+            self._pipeline.shutdown()
+            self._pipeline = None
+            self._unsettled.clear()
+
+    def _pipeline_submit(self, func, *args) -> None:
+        future = self._pipeline.submit(func, *args)
+        with self._lock:
+            self._pipeline_tasks.append(future)
+
+    def _submit_parse(self, norm_url: str, local_path: Path, data: bytes) -> None:
+        """Queue a just-downloaded payload for parsing.
+
+        Blocks while PIPELINE_MAX_PENDING payloads are already waiting, so
+        a slow parser holds back the downloads instead of memory growing.
+        """
+        if self._pipeline is None:
+            return
+        self._pipeline_slots.acquire()
+
+        def parse() -> None:
             try:
-                rows = resp.json()
-                if len(rows) > 1:
-                    return rows[1][0]
-            except (json.JSONDecodeError, IndexError):
-                pass
-        return None
+                self._parse_arrived(norm_url, local_path, data)
+            finally:
+                self._pipeline_slots.release()
 
-    def discover_and_download_assets(self, resume: bool = False) -> None:
-        """Parse downloaded files for asset references and download missing ones."""
-        for round_num in range(1, 3):  # up to 2 rounds
-            new_urls: set[str] = set()
-            logger.info("Asset discovery round %d ...", round_num)
+        self._pipeline_submit(parse)
 
-            # Scan all downloaded HTML files
-            for norm_url, local_path in list(self.local_map.items()):
-                full_path = self.output_dir / local_path
-                if not full_path.exists():
-                    continue
-                suffix = local_path.suffix.lower()
+    def _parse_arrived(self, norm_url: str, local_path: Path, data: bytes) -> None:
+        with self._lock:
+            # A path downloaded twice must not keep the first payload's parse
+            self.links.discard(local_path)
+            self.external_links.pop(local_path, None)
+            self._parse_cache.pop(local_path, None)
+        if self._file_refs(norm_url, local_path, data) is not None and self._early_rewrite:
+            with self._lock:
+                self._unsettled[local_path] = norm_url
 
-                if suffix in (".html", ".htm") or (
-                    suffix == "" and norm_url in self.downloaded_urls
-                ):
-                    try:
-                        content = full_path.read_bytes()
-                        # Reconstruct original URL for resolving relative refs
-                        orig_url = self._norm_to_original(norm_url)
-                        refs = self.parse_html(content, orig_url)
-                        for ref in refs:
-                            if ref not in self.downloaded_urls and ref not in self.local_map:
-                                new_urls.add(ref)
-                    except Exception as exc:
-                        logger.debug("Error parsing HTML %s: %s", local_path, exc)
-
-                elif suffix == ".css":
-                    try:
-                        content = full_path.read_text(encoding="utf-8", errors="replace")
-                        orig_url = self._norm_to_original(norm_url)
-                        refs = self.parse_css(content, orig_url)
-                        for ref in refs:
-                            if ref not in self.downloaded_urls and ref not in self.local_map:
-                                new_urls.add(ref)
-                    except Exception as exc:
-                        logger.debug("Error parsing CSS %s: %s", local_path, exc)
+    def _rewrite_settled(self, pending: set[Path]) -> None:
+        """Rewrite, in the background, files whose link targets are all mapped.
+
+        Once every URL a file references is in local_map, its rewrite can
+        no longer change, unless the file is about to be downloaded again
+        (it is in ``pending``) or shares its path with other URLs, whose
+        rewrites must keep their Phase 4 order.  Like every rewrite, each
+        is journaled before the file is replaced, so a run interrupted in
+        the asset waves resumes from the journaled links, not the
+        rewritten bytes.
+        """
+        if not self._early_rewrite:
+            return
+        owners: dict[Path, int] = defaultdict(int)
+        for local_path in self.local_map.values():
+            owners[local_path] += 1
+        for local_path, norm_url in list(self._unsettled.items()):
+            refs = self.links.get(local_path)
+            if refs is None or owners[local_path] > 1:
+                # Overwritten since it was parsed, or shared: leave to Phase 4
+                del self._unsettled[local_path]
+                continue
+            if local_path in pending or not all(ref in self.local_map for ref in refs):
+                continue
+            del self._unsettled[local_path]
+            self._pipeline_submit(self._rewrite_early, norm_url, local_path)
+
+    def _rewrite_early(self, norm_url: str, local_path: Path) -> None:
+        if local_path.suffix.lower() == ".css":
+            self.rewrite_css_links(norm_url)
+        else:
+            self.rewrite_html_links(norm_url)
+        with self._lock:
+            self.rewritten_files.setdefault(local_path, set()).add(norm_url)
+
+    def discover_and_download_assets(
+        self, resume: bool = False,
+        files: Optional[list[tuple[str, Path]]] = None,
+    ) -> None:
+        """Parse downloaded files for asset references and download missing ones.
+
+        Works through a frontier of files not yet scanned, wave by wave:
+        each HTML/CSS file is parsed once, when it arrives, and the assets
+        it references are downloaded and become the next wave, until no
+        new references turn up or the --max-depth/--max-assets budget is
+        spent.  Each wave's captures are resolved in one batch.  Files the
+        pipeline thread parsed on download are not read again, and those
+        whose targets the wave settles are rewritten while it downloads.
+        The first wave is ``files`` (default: every downloaded file).
+        """
+        frontier = files if files is not None else [
+            (norm_url, local_path)
+            for norm_url, local_path in self.local_map.items()
+            if norm_url in self.downloaded_urls
+        ]
+        depth = 0
+        while frontier:
+            depth += 1
+            if self.max_depth is not None and depth > self.max_depth:
+                logger.info(
+                    "  Asset depth budget reached; %d files left unscanned",
+                    len(frontier),
+                )
+                break
+            logger.info(
+                "Asset discovery wave %d (%d files) ...", depth, len(frontier)
+            )
+
+            # Payloads parsed on arrival are scanned by now
+            self._pipeline_drain()
+            if self.jobs > 1:
+                self._scan_files_in_jobs(frontier)
+            new_urls: set[str] = set()
+            for norm_url, local_path in frontier:
+                refs = self._file_refs(norm_url, local_path)
+                for ref in refs or ():
+                    if (ref not in self.downloaded_urls and ref not in self.local_map
+                            and ref not in self._over_budget):
+                        new_urls.add(ref)
 
             if not new_urls:
-                logger.info("  No new assets found in round %d", round_num)
+                logger.info("  No new assets found in wave %d", depth)
                 break
 
-            logger.info("  Found %d new asset URLs in round %d", len(new_urls), round_num)
+            logger.info("  Found %d new asset URLs in wave %d", len(new_urls), depth)
             self.stats.asset_discovered += len(new_urls)
+            queued = sorted(new_urls)
+            if self.max_assets is not None:
+                budget = max(0, self.max_assets - self._assets_queued)
+                if len(queued) > budget:
+                    logger.info(
+                        "  Asset budget reached; skipping %d URLs",
+                        len(queued) - budget,
+                    )
+                    queued = queued[:budget]
+                self._assets_queued += len(queued)
 
             # Download new assets
-            for i, norm_url in enumerate(sorted(new_urls), 1):
+            frontier = []
+            pending: list[tuple[str, str, Path]] = []
+            for norm_url in queued:
                 orig_url = self._norm_to_original(norm_url)
                 local_path = self.url_to_local_path(orig_url)
                 self.local_map[norm_url] = local_path
 
-                full_path = self.output_dir / local_path
-                if resume and full_path.exists() and full_path.stat().st_size > 0:
+                if resume and self._resumable(norm_url, local_path):
+                    record = self._journaled_file(norm_url, local_path) or {}
                     self.downloaded_urls.add(norm_url)
+                    self._remember(
+                        norm_url, orig_url, record.get("timestamp"),
+                        record.get("digest"), local_path, record.get("size"),
+                    )
+                    frontier.append((norm_url, local_path))
+                    continue
+                if self._known_missing(norm_url, orig_url, f"asset_round_{depth}"):
                     continue
+                pending.append((norm_url, orig_url, local_path))
+            self._rewrite_settled({local_path for _, _, local_path in pending})
+            if pending and self._budget_spent():
+                # Nothing more fits: no point looking the captures up
+                logger.info("  Budget spent; skipping %d asset URLs", len(pending))
+                self.stats.over_budget += len(pending)
+                self._over_budget.update(norm_url for norm_url, _, _ in pending)
+                continue
 
-                # Try to find timestamp from CDX
-                ts = self._find_best_timestamp(orig_url)
-                if ts is None:
-                    ts = self.target_timestamp
+            # Find captures from CDX, a few prefix queries at a time
+            captures = self.resolve_asset_captures(
+                [norm_url for norm_url, _, _ in pending]
+            )
+            if self.prefer is not None:
+                pending.sort(key=lambda item: self._preference(item[2]))
 
-                content = self.download_url(orig_url, ts)
-                if content is not None:
-                    self.save_file(content, local_path)
+            for i, (norm_url, orig_url, local_path) in enumerate(pending, 1):
+                entry = captures.get(norm_url)
+                if not self._reserve(entry.length if entry else None):
+                    self.stats.over_budget += 1
+                    self._over_budget.add(norm_url)
+                    continue
+                ts = str(entry.timestamp) if entry else self.target_timestamp
+                digest = entry.digest if entry else None
+                size = self.download_url(orig_url, ts, local_path, digest)
+                if size is not None:
                     self.downloaded_urls.add(norm_url)
                     self.stats.asset_downloaded += 1
+                    self._remember(norm_url, orig_url, ts, digest, local_path, size)
+                    frontier.append((norm_url, local_path))
                     if self.verbose:
                         logger.info(
                             "  [asset %d/%d] %s -> %s",
-                            i, len(new_urls), norm_url, local_path,
+                            i, len(pending), norm_url, local_path,
                         )
                 else:
-                    self.stats.failures.append(
-                        {"url": orig_url, "phase": f"asset_round_{round_num}"}
-                    )
+                    self._record_failure(norm_url, orig_url, f"asset_round_{depth}")
+
+                self._pause()
 
-                if self.delay > 0:
-                    time.sleep(self.delay)
+    def _scan_files_in_jobs(self, files: list[tuple[str, Path]]) -> None:
+        """Parse the not yet scanned HTML/CSS files in --jobs processes."""
+        items = [
+            (norm_url, local_path)
+            for norm_url, local_path in files
+            if self.links.get(local_path) is None
+            and local_path.suffix.lower() in (".html", ".htm", ".css", "")
+        ]
+        if len(items) < 2:
+            return
+        logger.info("  Parsing %d files in %d processes", len(items), self.jobs)
+        results = self._map_jobs(_job_file_refs, items)
+        for (_, local_path), (found, external) in zip(items, results):
+            if found is not None:
+                self.links.record(local_path, found)
+            if external is not None:
+                self.external_links[local_path] = external
 
     def _norm_to_original(self, norm_url: str) -> str:
         """Convert a normalized URL back to an original URL for resolving."""
@@ -615,23 +3078,37 @@ class WaybackHarvester:
     # ------------------------------------------------------------------
 
     def _find_local_file(self, target_norm_url: str) -> Optional[Path]:
-        """Find the local file for a normalized URL."""
-        if target_norm_url in self.local_map:
-            return self.local_map[target_norm_url]
-        # Try with/without trailing index.html
-        parsed = urlparse(target_norm_url)
-        alt_path = parsed.path.rstrip("/")
-        alt1 = urlunparse(
-            (parsed.scheme, parsed.netloc, alt_path, "", "", "")
-        )
-        if alt1 in self.local_map:
-            return self.local_map[alt1]
-        alt2 = urlunparse(
-            (parsed.scheme, parsed.netloc, alt_path + "/", "", "", "")
-        )
-        if alt2 in self.local_map:
-            return self.local_map[alt2]
-        return None
+        """Find the local file for a normalized URL (or an alias of one)."""
+        local_path = self.local_map.get(target_norm_url)
+        if local_path is not None:
+            return local_path
+        if self._aliased != len(self.local_map):
+            self._index_aliases()
+        key = self._aliases.get(target_norm_url)
+        return self.local_map.get(key) if key is not None else None
+
+    def _index_aliases(self) -> None:
+        """Add alias spellings for local_map keys added since the last call.
+
+        Normalized URLs already fold www., :80 and trailing slashes; what
+        remains is a directory page and its explicit index file, in both
+        directions.
+        """
+        keys = list(self.local_map)
+        for key in keys[self._aliased:]:
+            base = key.rstrip("/")
+            for index in ("/index.html", "/index.htm"):
+                if base.endswith(index):
+                    directory = base[: -len(index)]
+                    if urlparse(directory).path:
+                        self._aliases.setdefault(directory, key)
+                    else:
+                        self._aliases.setdefault(directory + "/", key)
+                    break
+            else:
+                self._aliases.setdefault(base + "/index.html", key)
+                self._aliases.setdefault(base + "/index.htm", key)
+        self._aliased = len(keys)
 
     def compute_relative_path(self, from_file: Path, to_file: Path) -> str:
         """Compute a relative path from one local file to another."""
@@ -640,6 +3117,24 @@ class WaybackHarvester:
         # Use forward slashes
         return rel.replace("\\", "/")
 
+    def _replace_rewritten(
+        self, norm_url: str, local_path: Path, content: bytes,
+        refs: Optional[set[str]],
+    ) -> None:
+        """Replace a file with its rewritten content, journaling it first.
+
+        ``refs`` are the internal URLs the original content links to; the
+        journal keeps them for --resume, which cannot resolve the
+        rewritten relative links against the file's URL.
+        """
+        self.journal.record({
+            "rewritten": local_path.as_posix(),
+            "url": norm_url,
+            "sha1": hashlib.sha1(content).hexdigest(),
+            "refs": sorted(refs or ()),
+        }, flush=True)
+        atomic_write(self.output_dir / local_path, [content])
+
     def rewrite_html_links(self, norm_url: str) -> None:
         """Rewrite links in an HTML file to relative local paths."""
         local_path = self.local_map.get(norm_url)
@@ -648,78 +3143,73 @@ class WaybackHarvester:
         full_path = self.output_dir / local_path
         if not full_path.exists():
             return
+        if self.links.get(local_path) == set():
+            return  # discovery found no internal links to rewrite
+        if self.rewrite_mode == "patch":
+            self._patch_html_links(norm_url, local_path)
+            return
 
         try:
-            html_bytes = full_path.read_bytes()
-            soup = BeautifulSoup(html_bytes, "html.parser")
+            soup, refs = self._parse_page(local_path)
         except Exception:
             return
+        # The tree is about to be modified; it is no longer the file on disk
+        with self._lock:
+            self._parse_cache.pop(local_path, None)
 
         orig_url = self._norm_to_original(norm_url)
         changed = False
+        # Resolve before the tree changes, for the journal
+        found = self.links.get(local_path)
+        if found is None:
+            found = self._resolve_html_refs(refs, orig_url)
 
-        # Rewrite href/src attributes
-        attrs_to_check = [
-            ("a", "href"),
-            ("link", "href"),
-            ("script", "src"),
-            ("img", "src"),
-            ("source", "src"),
-            ("video", "src"),
-            ("audio", "src"),
-            ("video", "poster"),
-            ("object", "data"),
-            ("embed", "src"),
-        ]
-
-        for tag_name, attr in attrs_to_check:
-            for tag in soup.find_all(tag_name, attrs={attr: True}):
-                ref = tag[attr]
-                resolved = self.resolve_url(ref, orig_url)
-                if resolved and self.is_internal(resolved):
+        for ref in refs:
+            tag = ref.tag
+            if ref.kind == "url":
+                resolved = self.resolve_internal(tag[ref.attr], orig_url)
+                if resolved:
                     target_path = self._find_local_file(resolved)
                     if target_path:
                         rel = self.compute_relative_path(local_path, target_path)
-                        if tag[attr] != rel:
-                            tag[attr] = rel
+                        if tag[ref.attr] != rel:
+                            tag[ref.attr] = rel
                             changed = True
 
-        # Rewrite srcset
-        for tag in soup.find_all("img", srcset=True):
-            new_parts = []
-            srcset_changed = False
-            for part in tag["srcset"].split(","):
-                part = part.strip()
-                if not part:
-                    continue
-                tokens = part.split()
-                src = tokens[0]
-                descriptor = " ".join(tokens[1:]) if len(tokens) > 1 else ""
-                resolved = self.resolve_url(src, orig_url)
-                if resolved and self.is_internal(resolved):
-                    target_path = self._find_local_file(resolved)
-                    if target_path:
-                        rel = self.compute_relative_path(local_path, target_path)
-                        if rel != src:
-                            src = rel
-                            srcset_changed = True
-                entry = f"{src} {descriptor}".strip() if descriptor else src
-                new_parts.append(entry)
-            if srcset_changed:
-                tag["srcset"] = ", ".join(new_parts)
-                changed = True
+            elif ref.kind == "srcset":
+                new_parts = []
+                srcset_changed = False
+                for part in tag["srcset"].split(","):
+                    part = part.strip()
+                    if not part:
+                        continue
+                    tokens = part.split()
+                    src = tokens[0]
+                    descriptor = " ".join(tokens[1:]) if len(tokens) > 1 else ""
+                    resolved = self.resolve_internal(src, orig_url)
+                    if resolved:
+                        target_path = self._find_local_file(resolved)
+                        if target_path:
+                            rel = self.compute_relative_path(local_path, target_path)
+                            if rel != src:
+                                src = rel
+                                srcset_changed = True
+                    entry = f"{src} {descriptor}".strip() if descriptor else src
+                    new_parts.append(entry)
+                if srcset_changed:
+                    tag["srcset"] = ", ".join(new_parts)
+                    changed = True
 
-        # Rewrite inline style url()
-        for tag in soup.find_all(style=True):
-            new_style = self._rewrite_css_urls(tag["style"], orig_url, local_path)
-            if new_style != tag["style"]:
-                tag["style"] = new_style
-                changed = True
+            elif ref.attr:
+                # Inline style url()
+                new_style = self._rewrite_css(tag[ref.attr], orig_url, local_path)
+                if new_style != tag[ref.attr]:
+                    tag[ref.attr] = new_style
+                    changed = True
 
-        # Rewrite <style> blocks
-        for tag in soup.find_all("style"):
-            if tag.string:
-                new_css = self._rewrite_css_urls(tag.string, orig_url, local_path)
+            else:
+                # <style> block
+                new_css = self._rewrite_css(tag.string, orig_url, local_path)
                 if new_css != tag.string:
                     tag.string = new_css
                     changed = True
@@ -727,55 +3217,153 @@ class WaybackHarvester:
         if changed:
             # Write back
             html_out = soup.encode(soup.original_encoding or "utf-8")
-            full_path.write_bytes(html_out)
+            self._replace_rewritten(norm_url, local_path, html_out, found)
             self.stats.rewritten_html += 1
 
-    def _rewrite_css_urls(
-        self, css_text: str, base_url: str, from_file: Path
+    def _rewrite_css(
+        self, css_text: str, base_url: str, from_file: Path, codec=None
     ) -> str:
-        """Rewrite url() references in CSS text."""
+        """Rewrite url() and @import references in CSS text in one pass.
+
+        ``codec`` is an optional (decode, encode) pair applied to each
+        reference when ``css_text`` is raw document bytes (patch mode).
+        """
         def replacer(match):
             full_match = match.group(0)
-            ref = match.group(1)
+            ref = match.group("imp") or match.group("url")
+            if codec:
+                ref = codec[0](ref)
             if ref.startswith("data:"):
                 return full_match
-            resolved = self.resolve_url(ref, base_url)
-            if resolved and self.is_internal(resolved):
+            resolved = self.resolve_internal(ref, base_url)
+            if resolved:
                 target_path = self._find_local_file(resolved)
                 if target_path:
                     rel = self.compute_relative_path(from_file, target_path)
-                    return f"url({rel})"
+                    if codec:
+                        rel = codec[1](rel)
+                    if match.group("url"):
+                        return f"url({rel})"
+                    # Preserve the import format, and url() quoting
+                    if "url(" in full_match:
+                        quote = match.string[match.start("imp") - 1]
+                        quote = quote if quote in "\"'" else ""
+                        return f"@import url({quote}{rel}{quote})"
+                    return f'@import "{rel}"'
             return full_match
 
-        return re.sub(
-            r'url\s*\(\s*["\']?([^"\')\s]+)["\']?\s*\)',
-            replacer,
-            css_text,
-        )
+        return CSS_REF_RE.sub(replacer, css_text)
+
+    def _patch_html_links(self, norm_url: str, local_path: Path) -> None:
+        """Rewrite links by splicing new values into the original bytes.
+
+        Only the attribute values and <style> text that actually change
+        are touched; every other byte of the file is left as archived.
+        """
+        full_path = self.output_dir / local_path
+        try:
+            html_bytes = full_path.read_bytes()
+        except OSError:
+            return
+        encoding = EncodingDetector.find_declared_encoding(
+            html_bytes, is_html=True
+        ) or "utf-8"
+        try:
+            "".encode(encoding)
+        except LookupError:
+            encoding = "utf-8"
+
+        # latin-1 maps each byte to one character, so the scanner's
+        # offsets are byte offsets and untouched bytes round-trip exactly
+        text = html_bytes.decode("latin-1")
+        scanner = HtmlSpanScanner()
+        with self.metrics.span("parse", "html_scan"):
+            scanner.feed(text)
+            scanner.close()
+
+        orig_url = self._norm_to_original(norm_url)
+        pieces: list[str] = []
+        pos = 0
+        for span in scanner.spans:
+            raw = text[span.start:span.end]
+            new_raw = self._patch_span(span, raw, encoding, orig_url, local_path)
+            if new_raw is None or new_raw == raw:
+                continue
+            if span.kind != "css" and not span.quote:
+                new_raw = f'"{new_raw}"'
+            pieces.append(text[pos:span.start])
+            pieces.append(new_raw)
+            pos = span.end
+        if not pieces:
+            return
+        pieces.append(text[pos:])
+        self._replace_rewritten(
+            norm_url, local_path, "".join(pieces).encode("latin-1"),
+            self._file_refs(norm_url, local_path),
+        )
+        self.stats.rewritten_html += 1
+
+    def _patch_span(
+        self, span: HtmlSpan, raw: str, encoding: str, base_url: str,
+        from_file: Path,
+    ) -> Optional[str]:
+        """Compute the replacement for one raw value, or None to keep it."""
+        quote = span.quote or '"'
+
+        def decode(value: str) -> str:
+            value = value.encode("latin-1").decode(encoding, "replace")
+            return value if span.kind == "css" else html.unescape(value)
+
+        def encode(value: str) -> str:
+            if span.kind != "css":
+                value = value.replace("&", "&amp;").replace(
+                    quote, "&quot;" if quote == '"' else "&#39;"
+                )
+            return value.encode(encoding, "xmlcharrefreplace").decode("latin-1")
 
-    def _rewrite_css_imports(
-        self, css_text: str, base_url: str, from_file: Path
-    ) -> str:
-        """Rewrite @import references in CSS text."""
-        def replacer(match):
-            full_match = match.group(0)
-            ref = match.group(1)
-            resolved = self.resolve_url(ref, base_url)
-            if resolved and self.is_internal(resolved):
+        if span.kind == "css":
+            # <style> text: patch each url()/@import in place
+            new_raw = self._rewrite_css(
+                raw, base_url, from_file, codec=(decode, encode)
+            )
+            return new_raw if new_raw != raw else None
+        if span.kind == "style":
+            # Attribute may hold entities (&quot;), so rewrite decoded CSS
+            value = decode(raw)
+            new_value = self._rewrite_css(value, base_url, from_file)
+            return encode(new_value) if new_value != value else None
+
+        def relocate(ref: str) -> Optional[str]:
+            resolved = self.resolve_internal(ref, base_url)
+            if resolved:
                 target_path = self._find_local_file(resolved)
                 if target_path:
                     rel = self.compute_relative_path(from_file, target_path)
-                    # Preserve the import format
-                    if "url(" in full_match:
-                        return f'@import url("{rel}")'
-                    return f'@import "{rel}"'
-            return full_match
+                    if rel != ref:
+                        return rel
+            return None
 
-        return re.sub(
-            r'@import\s+(?:url\s*\(\s*)?["\']?([^"\')\s;]+)["\']?\s*\)?',
-            replacer,
-            css_text,
-        )
+        value = decode(raw)
+        if span.kind == "url":
+            rel = relocate(value)
+            return encode(rel) if rel is not None else None
+
+        # srcset
+        new_parts = []
+        srcset_changed = False
+        for part in value.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            tokens = part.split()
+            src = tokens[0]
+            descriptor = " ".join(tokens[1:]) if len(tokens) > 1 else ""
+            rel = relocate(src)
+            if rel is not None:
+                src = rel
+                srcset_changed = True
+            new_parts.append(f"{src} {descriptor}".strip() if descriptor else src)
+        return encode(", ".join(new_parts)) if srcset_changed else None
 
     def rewrite_css_links(self, norm_url: str) -> None:
         """Rewrite links in a CSS file."""
@@ -794,28 +3382,335 @@ class WaybackHarvester:
             return
 
         orig_url = self._norm_to_original(norm_url)
-        new_text = self._rewrite_css_urls(css_text, orig_url, local_path)
-        new_text = self._rewrite_css_imports(new_text, orig_url, local_path)
+        new_text = self._rewrite_css(css_text, orig_url, local_path)
 
         if new_text != css_text:
-            full_path.write_text(new_text, encoding="utf-8")
+            refs = self.links.get(local_path)
+            if refs is None:
+                refs = self.parse_css(css_text, orig_url)
+            self._replace_rewritten(
+                norm_url, local_path, new_text.encode("utf-8"), refs
+            )
             self.stats.rewritten_css += 1
 
-    def rewrite_all_links(self) -> None:
-        """Rewrite links in all downloaded files."""
-        logger.info("Rewriting links in %d files ...", len(self.local_map))
-        for norm_url, local_path in self.local_map.items():
+    def rewrite_all_links(self, only: Optional[set[str]] = None) -> None:
+        """Rewrite links in all downloaded files (or just those in ``only``).
+
+        Files already rewritten, by the pipeline during the downloads or
+        by an interrupted run being resumed, are skipped.
+        """
+        items = [
+            (norm_url, local_path)
+            for norm_url, local_path in self.local_map.items()
+            if (only is None or norm_url in only)
+            and norm_url not in self.rewritten_files.get(local_path, ())
+        ]
+        logger.info("Rewriting links in %d files ...", len(items))
+        if self.rewritten_files:
+            logger.info(
+                "  (%d more were already rewritten)", len(self.rewritten_files)
+            )
+        tasks: list[tuple[str, str]] = []
+        for norm_url, local_path in items:
             suffix = local_path.suffix.lower()
             if suffix in (".html", ".htm") or suffix == "":
                 # Check if it's actually HTML
                 full_path = self.output_dir / local_path
                 if full_path.exists() and local_path.name == "index.html":
-                    self.rewrite_html_links(norm_url)
+                    tasks.append((norm_url, "html"))
                 elif full_path.exists() and suffix in (".html", ".htm"):
-                    self.rewrite_html_links(norm_url)
+                    tasks.append((norm_url, "html"))
             elif suffix == ".css":
+                tasks.append((norm_url, "css"))
+
+        if self.jobs > 1 and len(tasks) > 1:
+            # Workers have no link graph, so skip link-free pages here
+            tasks = [
+                (norm_url, kind) for norm_url, kind in tasks
+                if kind == "css" or self.links.get(self.local_map[norm_url]) != set()
+            ]
+            # Workers append their rewrite records after ours
+            self.journal.flush()
+            self._map_jobs(_job_rewrite, tasks)
+            # Rewritten files no longer match any tree parsed before
+            self._parse_cache.clear()
+            return
+        for norm_url, kind in tasks:
+            if kind == "html":
+                self.rewrite_html_links(norm_url)
+            else:
                 self.rewrite_css_links(norm_url)
 
+    # ------------------------------------------------------------------
+    # Phase 4b: External link check
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _link_key(url: str) -> str:
+        """Check key for an external URL: lowercase host, no fragment."""
+        parsed = urlparse(url)
+        return urlunparse((
+            parsed.scheme.lower(), parsed.netloc.lower(), parsed.path or "/",
+            parsed.params, parsed.query, "",
+        ))
+
+    def archive_html_pages(self) -> list[tuple[Path, str]]:
+        """(local path, page URL) for every HTML file already in the output dir."""
+        pages = []
+        for full_path in sorted(self.output_dir.rglob("*.htm*")):
+            local_path = full_path.relative_to(self.output_dir)
+            if local_path.parts[0] == STATE_DIR or full_path.suffix.lower() not in (".html", ".htm"):
+                continue
+            pages.append((local_path, f"http://{self.domain}/{local_path.as_posix()}"))
+        return pages
+
+    def check_external_links(
+        self, mark: bool = False, pages: Optional[list[tuple[Path, str]]] = None,
+    ) -> None:
+        """Check external links and write dead_links_report.json.
+
+        ``pages`` defaults to the harvested HTML files; links found during
+        discovery are reused and other pages are parsed here.  With
+        ``mark``, each dead <a> is replaced by "text [Dead Link, url]".
+        """
+        if pages is None:
+            pages = [
+                (local_path, self._norm_to_original(norm_url))
+                for norm_url, local_path in self.local_map.items()
+                if local_path.suffix.lower() in (".html", ".htm")
+                and (self.output_dir / local_path).exists()
+            ]
+        for local_path, page_url in pages:
+            if local_path in self.external_links:
+                continue
+            try:
+                _, refs = self._parse_page(local_path)
+            except Exception as exc:
+                logger.debug("Error parsing HTML %s: %s", local_path, exc)
+                continue
+            self.external_links[local_path] = self._external_refs(refs, page_url)
+
+        by_file = {
+            local_path: self.external_links.get(local_path, [])
+            for local_path, _ in pages
+        }
+        unique = {url for urls in by_file.values() for url in urls}
+        logger.info(
+            "Checking %d external links (%d unique URLs) ...",
+            sum(len(urls) for urls in by_file.values()), len(unique),
+        )
+        checker = LinkChecker(
+            self.output_dir / STATE_DIR / "linkcheck.json",
+            ttl=self.link_cache_ttl,
+            workers=LINK_CHECK_WORKERS,
+            per_host=LINK_CHECK_PER_HOST,
+            timeout=LINK_CHECK_TIMEOUT,
+            metrics=self.metrics,
+        )
+        results = checker.check({self._link_key(url) for url in unique})
+
+        dead: dict[str, str] = {}
+        restored: dict[str, str] = {}
+        hosts: set[str] = set()
+        for url in sorted(unique):
+            reason = results.get(self._link_key(url))
+            if reason is None:
+                continue
+            host = (urlparse(url).hostname or "").lower()
+            blocking = [
+                h for h in BOT_BLOCKING_HOSTS
+                if host == h or host.endswith("." + h)
+            ]
+            if blocking:
+                restored[url] = reason
+                hosts.update(blocking)
+            else:
+                dead[url] = reason
+
+        files_modified: dict[str, list[str]] = {}
+        for local_path, page_url in pages:
+            urls = by_file[local_path]
+            dead_here = list(dict.fromkeys(url for url in urls if url in dead))
+            if dead_here:
+                files_modified[local_path.as_posix()] = dead_here
+                if mark:
+                    self._mark_dead_links(local_path, page_url, set(dead_here))
+
+        report = {
+            "total_external_links": sum(len(urls) for urls in by_file.values()),
+            "unique_urls_checked": len(unique),
+            "dead_count": len(dead),
+            "live_count": len(unique) - len(dead),
+            "dry_run": not mark,
+            "dead_links": dead,
+            "files_modified": files_modified,
+            "restored_false_positives": restored,
+            "note": (
+                f"Links to {', '.join(sorted(hosts))} were restored (they block bots "
+                "with 403 but are live)." if hosts else ""
+            ),
+        }
+        report_path = self.output_dir / DEAD_LINK_REPORT
+        atomic_write(
+            report_path,
+            [json.dumps(report, indent=2, ensure_ascii=False).encode("utf-8")],
+        )
+        logger.info(
+            "  %d dead, %d live; report written to %s",
+            len(dead), len(unique) - len(dead), report_path,
+        )
+
+    def _mark_dead_links(
+        self, local_path: Path, page_url: str, dead: set[str]
+    ) -> None:
+        """Replace each dead <a> in a file with "text [Dead Link, url]"."""
+        full_path = self.output_dir / local_path
+        self._parse_cache.pop(local_path, None)
+        try:
+            soup = BeautifulSoup(full_path.read_bytes(), self.parser)
+        except Exception:
+            return
+        changed = False
+        for tag in soup.find_all("a", href=True):
+            href = tag["href"].strip()
+            if urljoin(page_url, href) in dead:
+                text = tag.get_text().strip()
+                tag.replace_with(f"{text} [Dead Link, {href}]".lstrip())
+                changed = True
+        if changed:
+            atomic_write(full_path, [soup.encode(soup.original_encoding or "utf-8")])
+
+    # ------------------------------------------------------------------
+    # Incremental state
+    # ------------------------------------------------------------------
+
+    def load_state(self) -> None:
+        """Load the previous run's state file for an incremental harvest."""
+        try:
+            state = json.loads(self.state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            logger.info("No usable state file at %s; harvesting everything", self.state_path)
+            return
+        if (state.get("domain") != self.domain
+                or state.get("target_timestamp") != self.target_timestamp):
+            logger.warning("State file is for a different domain/timestamp; ignoring it")
+            return
+        self.prior_state = state.get("urls", {})
+        self.links = LinkGraph.from_json(state.get("refs", {}))
+        self.rewritten_map = state.get("rewritten_map", {})
+        self.pending_rewrite = {Path(p) for p in state.get("pending_rewrite", [])}
+        logger.info("Loaded state for %d URLs", len(self.prior_state))
+
+    def load_journal(self) -> None:
+        """Read the download journal left by an earlier run, for --resume."""
+        self.journaled = self.journal.replay()
+        if self.journaled is None:
+            logger.info("No download journal; --resume will check files on disk")
+            return
+        self._journaled_paths = {
+            record["path"] for record in self.journaled.values()
+            if not record.get("failed")
+        }
+        failed = sum(1 for record in self.journaled.values() if record.get("failed"))
+        logger.info(
+            "Journal: %d files downloaded, %d failures",
+            len(self.journaled) - failed, failed,
+        )
+        for path, records in self.journal.rewrites.items():
+            local_path = Path(path)
+            try:
+                sha1 = hashlib.sha1((self.output_dir / local_path).read_bytes()).hexdigest()
+            except OSError:
+                continue
+            # Rewrites up to the one whose content is on disk took place;
+            # none did if the crash came before the first replacement
+            done = [i for i, record in enumerate(records) if record["sha1"] == sha1]
+            if not done:
+                continue
+            records = records[: done[-1] + 1]
+            # The rewritten file no longer says what it linked to
+            self.links.record(local_path, set(records[0]["refs"]))
+            self.rewritten_files[local_path] = {record["url"] for record in records}
+        if self.rewritten_files:
+            logger.info(
+                "Journal: %d files already rewritten", len(self.rewritten_files)
+            )
+
+    def restore_prior_assets(self) -> None:
+        """Adopt assets from the previous run whose files are still present.
+
+        Discovered assets have no fresh CDX row to compare against, so an
+        incremental run keeps them rather than resolving them again.
+        """
+        restored = 0
+        for norm_url, record in self.prior_state.items():
+            if norm_url in self.local_map:
+                continue
+            local_path = Path(record["path"])
+            if (self.output_dir / local_path).exists():
+                self.local_map[norm_url] = local_path
+                self.downloaded_urls.add(norm_url)
+                self.harvested[norm_url] = record
+                restored += 1
+        if restored:
+            logger.info("Kept %d previously harvested assets", restored)
+
+    def affected_urls(self) -> set[str]:
+        """URLs whose files must be rewritten after an incremental harvest.
+
+        These are files written since they were last rewritten, plus (via
+        the link graph's reverse index) files linking to a URL whose local
+        path differs from the one used at the last rewrite.  Work is
+        proportional to the changes and their in-degree, not the archive.
+        """
+        changed = {
+            norm_url for norm_url, local_path in self.local_map.items()
+            if self.rewritten_map.get(norm_url) != local_path.as_posix()
+        }
+        changed.update(u for u in self.rewritten_map if u not in self.local_map)
+        files = self.fresh_files | self.pending_rewrite | self.links.sources(changed)
+        # Files never scanned have no recorded links; rewrite them to be safe
+        files.update(
+            local_path for local_path in self.local_map.values()
+            if local_path.suffix.lower() in (".html", ".htm", ".css")
+            and self.links.get(local_path) is None
+        )
+        return {
+            norm_url for norm_url, local_path in self.local_map.items()
+            if local_path in files
+            and local_path.suffix.lower() in (".html", ".htm", ".css")
+        }
+
+    def save_state(self, rewritten: bool = True) -> None:
+        """Persist capture digests, paths and the link graph for next run.
+
+        ``rewritten`` is False after --skip-rewrite; the files written in
+        this run are then carried over as still needing a rewrite.
+        """
+        local_files = set(self.local_map.values())
+        if rewritten:
+            rewritten_map = {
+                norm_url: local_path.as_posix()
+                for norm_url, local_path in self.local_map.items()
+            }
+            pending: set[Path] = set()
+        else:
+            rewritten_map = self.rewritten_map
+            pending = self.pending_rewrite | self.fresh_files
+        state = {
+            "domain": self.domain,
+            "target_timestamp": self.target_timestamp,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "urls": self.harvested,
+            "refs": self.links.to_json(local_files),
+            "rewritten_map": rewritten_map,
+            "pending_rewrite": sorted(p.as_posix() for p in pending),
+        }
+        atomic_write(
+            self.state_path, [json.dumps(state, indent=1).encode("utf-8")]
+        )
+        logger.info("State written to %s", self.state_path)
+
     # ------------------------------------------------------------------
     # Phase 5: Report
     # ------------------------------------------------------------------
@@ -831,11 +3726,21 @@ class WaybackHarvester:
         print(f"  Downloaded (CDX):       {s.downloaded}")
         if s.skipped_resume:
             print(f"  Skipped (resume):       {s.skipped_resume}")
+        if s.unchanged:
+            print(f"  Unchanged (incremental):{s.unchanged:>5}")
+        if s.known_missing:
+            print(f"  Known missing (cached): {s.known_missing}")
+        if s.over_budget:
+            print(f"  Over budget (skipped):  {s.over_budget}")
         print(f"  Assets discovered:      {s.asset_discovered}")
         print(f"  Assets downloaded:       {s.asset_downloaded}")
         print(f"  HTML files rewritten:   {s.rewritten_html}")
         print(f"  CSS files rewritten:    {s.rewritten_css}")
         print(f"  Total bytes:            {s.bytes_total:,}")
+        if s.deduplicated:
+            print(f"  Linked from blob store: {s.deduplicated}")
+        if s.digest_mismatches:
+            print(f"  CDX digest mismatches:  {s.digest_mismatches}")
         print(f"  Failed downloads:       {len(s.failures)}")
         if s.by_extension:
             print("\n  Files by extension:")
@@ -843,6 +3748,17 @@ class WaybackHarvester:
                 s.by_extension.items(), key=lambda x: -x[1]
             ):
                 print(f"    {ext:12s} {count:5d}")
+        m = self.metrics
+        if m.phases:
+            print("\n  Seconds per phase:")
+            for name, seconds in m.phases.items():
+                print(f"    {name:12s} {seconds:8.1f}")
+            print("  Seconds by activity (summed over workers):")
+            for name in ("network", "sleep", "parse"):
+                print(f"    {name:12s} {m.seconds.get(name, 0.0):8.1f}")
+            retries = sum(n for by_reason in m.retries.values() for n in by_reason.values())
+            if retries:
+                print(f"  Retries:                {retries}")
         if s.failures:
             print(f"\n  Failed URLs ({len(s.failures)}):")
             for f in s.failures[:20]:
@@ -863,14 +3779,25 @@ class WaybackHarvester:
                 "after_dedup_filter": self.stats.cdx_after_dedup,
                 "downloaded_cdx": self.stats.downloaded,
                 "skipped_resume": self.stats.skipped_resume,
+                "unchanged": self.stats.unchanged,
+                "known_missing": self.stats.known_missing,
+                "over_budget": self.stats.over_budget,
                 "assets_discovered": self.stats.asset_discovered,
                 "assets_downloaded": self.stats.asset_downloaded,
                 "html_rewritten": self.stats.rewritten_html,
                 "css_rewritten": self.stats.rewritten_css,
                 "total_bytes": self.stats.bytes_total,
+                "deduplicated": self.stats.deduplicated,
+                "digest_mismatches": self.stats.digest_mismatches,
                 "failed_count": len(self.stats.failures),
                 "files_by_extension": dict(self.stats.by_extension),
             },
+            "metrics": self.metrics.to_json(),
+            "warc": {
+                "directory": str(self.warc.directory),
+                "files": [p.name for p in self.warc.files],
+                "records": len(self.warc.index),
+            } if self.warc is not None else None,
             "files": sorted(
                 str(p).replace("\\", "/")
                 for p in self.local_map.values()
@@ -884,33 +3811,207 @@ class WaybackHarvester:
         )
         logger.info("Manifest written to %s", manifest_path)
 
+    # ------------------------------------------------------------------
+    # Phase 6: Packaging
+    # ------------------------------------------------------------------
+
+    def _bundle_members(self) -> list[tuple[str, Path]]:
+        """(relative name, path) of the manifest's files plus the metadata files."""
+        names = sorted(
+            str(p).replace("\\", "/") for p in set(self.local_map.values())
+        )
+        extra = ["manifest.json", DEAD_LINK_REPORT, Path(__file__).name]
+        members = []
+        for rel in names + [name for name in extra if name not in names]:
+            path = self.output_dir / rel
+            if path.is_file():
+                members.append((rel, path))
+        return members
+
+    def _bag_tags(self, checksums: dict[str, str], payload_bytes: int) -> list[tuple[str, bytes]]:
+        """BagIt tag files for a payload with the given SHA-256 checksums."""
+        tags = [
+            ("bagit.txt", b"BagIt-Version: 1.0\nTag-File-Character-Encoding: UTF-8\n"),
+            ("bag-info.txt", (
+                f"Bagging-Date: {time.strftime('%Y-%m-%d')}\n"
+                f"External-Identifier: https://web.archive.org/web/{self.target_timestamp}/http://{self.domain}/\n"
+                f"Payload-Oxum: {payload_bytes}.{len(checksums)}\n"
+            ).encode("utf-8")),
+            ("manifest-sha256.txt", "".join(
+                f"{sha}  data/{rel}\n" for rel, sha in sorted(checksums.items())
+            ).encode("utf-8")),
+        ]
+        tags.append(("tagmanifest-sha256.txt", "".join(
+            f"{hashlib.sha256(data).hexdigest()}  {name}\n" for name, data in tags
+        ).encode("utf-8")))
+        return tags
+
+    def package_bundle(self, bundle_path: Path) -> None:
+        """Write the harvest as a BagIt bag inside a .zip or .tar.zst bundle.
+
+        Every file is read once: its SHA-256 for the bag manifest is taken
+        in the same pass that compresses or copies it.
+        """
+        if bundle_path.name.endswith(".zip"):
+            write = self._package_zip
+        elif bundle_path.name.endswith((".tar.zst", ".tzst")):
+            if zstandard is None:
+                raise RuntimeError("tar.zst bundles need the zstandard package")
+            write = self._package_tar_zst
+        else:
+            raise ValueError(f"unsupported bundle type: {bundle_path.name} (use .zip or .tar.zst)")
+        members = self._bundle_members()
+        root = f"{self.domain}-{self.target_timestamp}"
+        logger.info("Packaging %d files into %s ...", len(members), bundle_path)
+        bundle_path.parent.mkdir(parents=True, exist_ok=True)
+        part = bundle_path.with_name(f".{bundle_path.name}.part")
+        try:
+            with open(part, "wb") as f:
+                checksums = write(f, root, members)
+            os.replace(part, bundle_path)
+        except BaseException:
+            part.unlink(missing_ok=True)
+            raise
+        logger.info(
+            "Bundle written: %s (%d files, %s bytes)",
+            bundle_path, len(checksums), f"{bundle_path.stat().st_size:,}",
+        )
+
+    def _package_zip(self, f, root: str, members: list[tuple[str, Path]]) -> dict[str, str]:
+        """ZIP: files are deflated in parallel threads and written in order."""
+        zw = ZipBundleWriter(f)
+        checksums: dict[str, str] = {}
+        payload_bytes = 0
+        workers = self.jobs if self.jobs > 1 else (os.cpu_count() or 1)
+        with thread_pool(workers) as pool:
+            def submit(rel: str, path: Path):
+                if path.suffix.lower() in STORED_EXTENSIONS:
+                    return rel, path, None
+                return rel, path, pool.submit(deflate_file, path)
+
+            # Compress a bounded window ahead of the writer
+            pending = iter(members)
+            window = deque(submit(*m) for m in islice(pending, workers * 2))
+            while window:
+                rel, path, future = window.popleft()
+                following = next(pending, None)
+                if following is not None:
+                    window.append(submit(*following))
+                arcname = f"{root}/data/{rel}"
+                if future is None:
+                    checksums[rel] = zw.add_stored(arcname, path)
+                    payload_bytes += path.stat().st_size
+                else:
+                    spool, crc, size, compressed, sha256 = future.result()
+                    with spool:
+                        zw.add_deflated(arcname, spool, crc, size, compressed, path.stat().st_mtime)
+                    checksums[rel] = sha256
+                    payload_bytes += size
+        for name, data in self._bag_tags(checksums, payload_bytes):
+            zw.add_bytes(f"{root}/{name}", data)
+        zw.close()
+        return checksums
+
+    def _package_tar_zst(self, f, root: str, members: list[tuple[str, Path]]) -> dict[str, str]:
+        """tar.zst: one tar stream through zstd's multithreaded compressor.
+
+        zstd cannot switch compression off per member, but it passes over
+        incompressible data (images, PDFs) quickly.
+        """
+        checksums: dict[str, str] = {}
+        payload_bytes = 0
+        threads = self.jobs if self.jobs > 1 else -1  # -1: all cores
+        cctx = zstandard.ZstdCompressor(level=10, threads=threads)
+        with cctx.stream_writer(f, closefd=False) as zst:
+            with tarfile.open(fileobj=zst, mode="w|", format=tarfile.PAX_FORMAT) as tar:
+                for rel, path in members:
+                    info = tar.gettarinfo(str(path), f"{root}/data/{rel}")
+                    with open(path, "rb") as src:
+                        reader = HashingReader(src)
+                        tar.addfile(info, reader)
+                    checksums[rel] = reader.sha256.hexdigest()
+                    payload_bytes += info.size
+                for name, data in self._bag_tags(checksums, payload_bytes):
+                    info = tarfile.TarInfo(f"{root}/{name}")
+                    info.size = len(data)
+                    info.mtime = int(time.time())
+                    tar.addfile(info, io.BytesIO(data))
+        return checksums
+
     # ------------------------------------------------------------------
     # Orchestration
     # ------------------------------------------------------------------
 
-    def run(self, skip_rewrite: bool = False, resume: bool = False) -> None:
-        """Run the full harvest pipeline."""
+    def run(
+        self, skip_rewrite: bool = False, resume: bool = False,
+        incremental: bool = False, check_links: bool = False,
+        mark_dead_links: bool = False, package: Optional[str] = None,
+        plan: bool = False, report: bool = True,
+    ) -> None:
+        """Run the full harvest pipeline (with ``plan``, only estimate it).
+
+        ``report=False`` leaves printing the plan or summary to the caller.
+        """
         start_time = time.time()
+        span = self.metrics.span
+        if incremental:
+            self.load_state()
+        if resume:
+            self.load_journal()
 
         # Phase 1: CDX Discovery
-        entries = self.query_cdx()
-        url_map = self.deduplicate_urls(entries)
-        url_map = self.filter_urls(url_map)
-        self.url_map = url_map
+        with span("phase", "cdx"):
+            url_map = self.deduplicate_urls(self.query_cdx())
+            url_map = self.filter_urls(url_map)
         self.stats.cdx_after_dedup = len(url_map)
         logger.info("URLs after dedup/filter: %d", len(url_map))
+        self.url_map = self.plan_downloads(url_map, resume=resume)
+        if plan:
+            if report:
+                self.print_plan()
+            self.metrics.close()
+            return
+        self.journal.open(truncate=not resume)
+        # Parsing (and, for a full rewrite, rewriting) overlaps Phases 2-3
+        self._pipeline_start(rewrite=not skip_rewrite and not incremental)
+        try:
+            # Phase 2: Download all CDX URLs
+            with span("phase", "download"):
+                self.download_all_cdx(resume=resume)
 
-        # Phase 2: Download all CDX URLs
-        self.download_all_cdx(resume=resume)
-
-        # Phase 3: Discover and download additional assets
-        self.discover_and_download_assets(resume=resume)
+            # Phase 3: Discover and download additional assets
+            with span("phase", "assets"):
+                if incremental:
+                    self.restore_prior_assets()
+                self.discover_and_download_assets(resume=resume)
+                self._pipeline_stop()
+        finally:
+            self._pipeline_stop()
+        if self.warc is not None:
+            self.warc.close(
+                self.warc.directory / f"{self.domain}.wacz" if self.wacz else None
+            )
+            logger.info(
+                "WARC: %d records in %d files under %s",
+                len(self.warc.index), len(self.warc.files), self.warc.directory,
+            )
 
         # Phase 4: Rewrite links
         if not skip_rewrite:
-            self.rewrite_all_links()
+            with span("phase", "rewrite"):
+                self.rewrite_all_links(
+                    only=self.affected_urls() if incremental else None
+                )
         else:
             logger.info("Skipping link rewriting (--skip-rewrite)")
+        if check_links or mark_dead_links:
+            with span("phase", "links"):
+                self.check_external_links(mark=mark_dead_links)
+        with span("phase", "state"):
+            self.save_state(rewritten=not skip_rewrite)
+            if self.misses is not None:
+                self.misses.save()
+        self.journal.close()
 
         # Copy this script into the output directory
         script_src = Path(__file__).resolve()
@@ -919,11 +4020,337 @@ class WaybackHarvester:
             shutil.copy2(script_src, script_dst)
 
         # Phase 5: Report
-        elapsed = time.time() - start_time
-        self.print_summary()
-        print(f"\n  Elapsed time: {elapsed:.0f}s")
+        if report:
+            elapsed = time.time() - start_time
+            self.print_summary()
+            print(f"\n  Elapsed time: {elapsed:.0f}s")
         self.write_manifest()
 
+        # Phase 6: Deposit bundle
+        if package:
+            with span("phase", "package"):
+                self.package_bundle(Path(package))
+        self.metrics.close()
+
+
+    def retry_failed(self, skip_rewrite: bool = False) -> None:
+        """Retry only the downloads the journal records as failed.
+
+        Everything else is taken from the journal and the state file: no
+        CDX listing.  Recovered HTML/CSS files are scanned for assets, as
+        in Phase 3, and the new ones downloaded.  URLs that still fail keep
+        their local paths, as in a full run.  Recovered files, including
+        those new assets, and the files linking to them are rewritten
+        (unless the journal shows they already were), and manifest.json is
+        updated in place.
+        """
+        self.load_journal()
+        if self.journaled is None:
+            logger.error("No download journal in %s; nothing to retry", self.journal.path)
+            return
+        self.load_state()
+        failed = []
+        for norm_url, record in self.journaled.items():
+            if record.get("failed"):
+                failed.append((norm_url, record["original"]))
+                continue
+            self.local_map[norm_url] = Path(record["path"])
+            self.downloaded_urls.add(norm_url)
+            self.harvested[norm_url] = {
+                key: record.get(key) for key in ("original", "timestamp", "digest", "path")
+            }
+        logger.info("Retrying %d failed downloads ...", len(failed))
+        self.journal.open()
+        captures = self.resolve_asset_captures([norm_url for norm_url, _ in failed])
+        recovered: set[str] = set()
+
+        def retry(item: tuple[str, str]) -> None:
+            norm_url, original = item
+            local_path = self.url_to_local_path(original)
+            entry = captures.get(norm_url)
+            ts = str(entry.timestamp) if entry else self.target_timestamp
+            digest = entry.digest if entry else None
+            size = self.download_url(original, ts, local_path, digest)
+            if size is None:
+                self._record_failure(norm_url, original, "retry")
+            else:
+                with self._lock:
+                    self.local_map[norm_url] = local_path
+                    self.downloaded_urls.add(norm_url)
+                    self.stats.downloaded += 1
+                    recovered.add(norm_url)
+                self._remember(norm_url, original, ts, digest, local_path, size)
+            self._pause()
+
+        self._map_workers(retry, failed)
+        logger.info("Recovered %d of %d", len(recovered), len(failed))
+        # Still-failed URLs stay mapped, so links to them are rewritten
+        # the way download_all_cdx() leaves them in a full run
+        for norm_url, original in failed:
+            self.local_map.setdefault(norm_url, self.url_to_local_path(original))
+        # Assets only the recovered files reference were never seen
+        if recovered:
+            before = set(self.downloaded_urls)
+            self.discover_and_download_assets(
+                files=[(norm_url, self.local_map[norm_url]) for norm_url in sorted(recovered)]
+            )
+            recovered |= self.downloaded_urls - before
+        if recovered and not skip_rewrite:
+            sources = self.links.sources(recovered)
+            self.rewrite_all_links(only={
+                norm_url for norm_url, local_path in self.local_map.items()
+                if local_path in sources or norm_url in recovered
+            })
+        self.save_state(rewritten=not skip_rewrite)
+        if self.misses is not None:
+            self.misses.save()
+        self.journal.close()
+        self._update_manifest(recovered)
+        self.metrics.close()
+
+    def _update_manifest(self, recovered: set[str]) -> None:
+        """Fold a --retry-failed-only pass into the existing manifest.json."""
+        manifest_path = self.output_dir / "manifest.json"
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.write_manifest()
+            return
+        originals = {self.harvested[norm_url]["original"] for norm_url in recovered}
+        failures = [f for f in manifest.get("failures", []) if f["url"] not in originals]
+        # New failures: assets the recovered files referenced
+        listed = {f["url"] for f in failures}
+        failures += [
+            f for f in self.stats.failures
+            if f["url"] not in listed and f["url"] not in originals
+        ]
+        manifest["failures"] = failures
+        # Like write_manifest(): every mapped path, including new failures
+        manifest["files"] = sorted(set(manifest.get("files", [])) | {
+            local_path.as_posix() for local_path in self.local_map.values()
+        })
+        manifest.setdefault("statistics", {})["failed_count"] = len(failures)
+        manifest_path.write_text(
+            json.dumps(manifest, indent=2, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        logger.info("Manifest updated: %d failures left", len(failures))
+
+
+# ---------------------------------------------------------------------------
+# Multi-target scheduling
+# ---------------------------------------------------------------------------
+
+
+def parse_target(spec: str, default_timestamp: str) -> tuple[str, str]:
+    """Split a ``--target DOMAIN[@TIMESTAMP]`` value."""
+    domain, _, timestamp = spec.partition("@")
+    domain = domain.strip().lower()
+    if domain.startswith("www."):
+        domain = domain[4:]
+    timestamp = timestamp.strip() or default_timestamp
+    if not domain or not timestamp.isdigit():
+        raise ValueError(f"bad target {spec!r} (expected DOMAIN[@TIMESTAMP])")
+    return domain, timestamp
+
+
+def per_target_path(path: str, label: str) -> str:
+    """``trace.json`` -> ``trace.<label>.json`` (keeps .tar.zst together)."""
+    p = Path(path)
+    suffix = "".join(p.suffixes[-2:]) if p.name.endswith(".tar.zst") else p.suffix
+    return str(p.with_name(f"{p.name[:len(p.name) - len(suffix)]}.{label}{suffix}"))
+
+
+class HarvestScheduler:
+    """Harvest several (domain, timestamp) targets at once.
+
+    Each target gets its own WaybackHarvester writing to
+    ``<output>/<label>`` (the domain, plus the timestamp if the domain is
+    listed more than once), with its own state, manifest and reports.
+    The targets run side by side and share one requests.Session and
+    connection pool, one rate limiter (so --rate/--delay is a budget for
+    the whole job, not per target), the CDX cache and the blob store
+    (with or without --dedup), so a payload captured under several
+    targets is fetched once.  Log messages are prefixed with the target label; summaries are
+    printed one target after another once all of them are done.  --jobs
+    is not supported here: each target would fork its worker processes
+    while the other targets' threads are running.
+    """
+
+    def __init__(self, targets: list[tuple[str, str]], output_dir: str, **options):
+        self.output_dir = Path(output_dir)
+        domains = [domain for domain, _ in targets]
+        self.labels = [
+            f"{domain}-{timestamp}" if domains.count(domain) > 1 else domain
+            for domain, timestamp in targets
+        ]
+        self.harvesters: list[WaybackHarvester] = []
+        for (domain, timestamp), label in zip(targets, self.labels):
+            # The CDX cache and blob store are shared (below), so the
+            # targets do not open their own
+            target_options = dict(
+                options, cdx_cache_ttl=0, cdx_cache_only=False, dedup=False
+            )
+            if options.get("trace_path"):
+                target_options["trace_path"] = per_target_path(options["trace_path"], label)
+            if options.get("warc_dir"):
+                target_options["warc_dir"] = str(Path(options["warc_dir"]) / label)
+            self.harvesters.append(WaybackHarvester(
+                domain=domain, timestamp=timestamp,
+                output_dir=str(self.output_dir / label), **target_options,
+            ))
+
+        first = self.harvesters[0]
+        threads = sum(h.workers for h in self.harvesters)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=threads
+        )
+        first.session.mount("https://", adapter)
+        first.session.mount("http://", adapter)
+        # Serial targets would each sleep --delay on their own; one bucket
+        # at the same spacing keeps the job as polite as a single run
+        limiter = first.rate_limiter
+        rate = options.get("rate")
+        delay = options.get("delay", 1.0)
+        if limiter is None and (rate or delay > 0):
+            limiter = TokenBucket(rate or 1.0 / delay, capacity=threads)
+        cdx_cache = None
+        cdx_cache_ttl = options.get("cdx_cache_ttl", 86400.0)
+        if cdx_cache_ttl > 0 or options.get("cdx_cache_only"):
+            cdx_cache = CdxCache(
+                self.output_dir / STATE_DIR / "cdx",
+                ttl=cdx_cache_ttl, offline=options.get("cdx_cache_only", False),
+            )
+        # Always shared, --dedup or not: payloads several targets have in
+        # common are the point of harvesting them together
+        blob_store = BlobStore(self.output_dir / STATE_DIR / "blobs")
+        for harvester in self.harvesters:
+            if harvester is not first:
+                harvester.session.close()
+            harvester.session = first.session
+            harvester.rate_limiter = limiter
+            harvester.cdx_cache = cdx_cache
+            harvester.blob_store = blob_store
+
+        if not any(isinstance(f, TargetLabelFilter) for f in logger.filters):
+            logger.addFilter(TargetLabelFilter())
+
+    def _each(self, func) -> None:
+        """Call ``func(harvester)`` for every target, all at once."""
+        def call(item: tuple[str, WaybackHarvester]) -> None:
+            label, harvester = item
+            set_log_label(label)
+            try:
+                func(harvester)
+            finally:
+                set_log_label(None)
+
+        with ThreadPoolExecutor(max_workers=len(self.harvesters)) as pool:
+            # list() re-raises the first target's exception, if any
+            list(pool.map(call, zip(self.labels, self.harvesters)))
+
+    def run(self, package: Optional[str] = None, **run_options) -> None:
+        """Run every target's full pipeline concurrently."""
+        start_time = time.time()
+        logger.info(
+            "Harvesting %d targets: %s", len(self.harvesters), ", ".join(self.labels)
+        )
+        self._each(lambda h: h.run(
+            package=per_target_path(package, h.output_dir.name) if package else None,
+            report=False, **run_options,
+        ))
+        for label, harvester in zip(self.labels, self.harvesters):
+            print(f"\n[{label}]", end="")
+            if run_options.get("plan"):
+                harvester.print_plan()
+            else:
+                harvester.print_summary()
+        print(f"\n{'=' * 60}")
+        if run_options.get("plan"):
+            # One shared rate limiter: the job takes as long as all its
+            # downloads at that rate
+            requests_needed = sum(h.plan["requests"] for h in self.harvesters)
+            for label, harvester in zip(self.labels, self.harvesters):
+                print(
+                    f"  {label:30s} {harvester.plan['requests']:6d} downloads, "
+                    f"{harvester.plan['bytes']:>16,} bytes"
+                )
+            rate = self.harvesters[0].plan["rate"]
+            if rate:
+                print(
+                    f"  Estimated time: at least "
+                    f"{format_duration(requests_needed / rate)} at {rate:g} req/s"
+                )
+            return
+        for label, harvester in zip(self.labels, self.harvesters):
+            stats = harvester.stats
+            print(
+                f"  {label:30s} {stats.downloaded + stats.asset_downloaded:6d} "
+                f"downloaded, {len(stats.failures):5d} failed"
+            )
+        print(f"  Elapsed time: {time.time() - start_time:.0f}s")
+
+    def retry_failed(self, skip_rewrite: bool = False) -> None:
+        """--retry-failed-only for every target."""
+        self._each(lambda h: h.retry_failed(skip_rewrite=skip_rewrite))
+
+    def check_external_links(self, mark: bool = False) -> None:
+        """--check-links-only for every target's existing output."""
+        def check(harvester: WaybackHarvester) -> None:
+            harvester.check_external_links(
+                mark=mark, pages=harvester.archive_html_pages()
+            )
+            harvester.metrics.close()
+        self._each(check)
+
+
+# ---------------------------------------------------------------------------
+# --jobs worker processes
+# ---------------------------------------------------------------------------
+
+# Per-process harvester holding the parent's URL maps (see _map_jobs)
+_job_harvester: Optional[WaybackHarvester] = None
+
+
+def _init_job_worker(config: dict, snapshot: dict, journal: bool = False) -> None:
+    global _job_harvester
+    _job_harvester = WaybackHarvester(**config)
+    for name, value in snapshot.items():
+        setattr(_job_harvester, name, value)
+    if journal:
+        # Rewrites are journaled by the process that makes them
+        _job_harvester.journal.attach()
+
+
+def _job_result(value):
+    """Return ``value`` with the stats and times this task added."""
+    harvester = _job_harvester
+    counts = {
+        "rewritten_html": harvester.stats.rewritten_html,
+        "rewritten_css": harvester.stats.rewritten_css,
+    }
+    seconds = dict(harvester.metrics.seconds)
+    harvester.stats = HarvestStats()
+    harvester.metrics.seconds.clear()
+    # Trees are not shared with the parent; don't keep them around
+    harvester._parse_cache.clear()
+    return value, counts, seconds
+
+
+def _job_file_refs(item: tuple[str, Path]):
+    norm_url, local_path = item
+    found = _job_harvester._file_refs(norm_url, local_path)
+    return _job_result((found, _job_harvester.external_links.pop(local_path, None)))
+
+
+def _job_rewrite(item: tuple[str, str]):
+    norm_url, kind = item
+    if kind == "html":
+        _job_harvester.rewrite_html_links(norm_url)
+    else:
+        _job_harvester.rewrite_css_links(norm_url)
+    return _job_result(None)
+
 
 # ---------------------------------------------------------------------------
 # CLI
@@ -945,6 +4372,15 @@ def main():
         default="20250612",
         help="Target Wayback Machine timestamp (default: 20250612)",
     )
+    parser.add_argument(
+        "--target",
+        action="append",
+        metavar="DOMAIN[@TIMESTAMP]",
+        default=None,
+        help="Harvest this target instead of --domain/--timestamp; repeat "
+             "to harvest several at once into OUTPUT/<domain>, sharing one "
+             "rate budget, connection pool and CDX cache",
+    )
     parser.add_argument(
         "-o", "--output",
         default=None,
@@ -962,16 +4398,195 @@ def main():
         default=5,
         help="Max retry attempts per URL (default: 5)",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Concurrent download workers (default: 1, serial)",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Processes for parsing and link rewriting (default: 1; "
+             "not with several --target)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="Requests per second shared by all workers (default: "
+             "1/delay; used with --workers > 1), or the ceiling for "
+             f"--adaptive (default: {ADAPTIVE_MAX_RATE:g})",
+    )
+    parser.add_argument(
+        "--adaptive",
+        action="store_true",
+        help="Adapt the request rate to the archive's responses (AIMD): "
+             "start at 1/delay, speed up while healthy, back off on "
+             "429/5xx and honour Retry-After",
+    )
+    parser.add_argument(
+        "--cdx-cache-ttl",
+        type=float,
+        default=24.0,
+        help="Hours to reuse cached CDX responses; 0 disables the cache "
+             "(default: 24)",
+    )
+    parser.add_argument(
+        "--cdx-cache-only",
+        action="store_true",
+        help="Replay cached CDX responses only, never query the CDX API",
+    )
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Fetch each payload once per CDX digest and hard-link "
+             "duplicates from a content-addressed store in .harvest/blobs "
+             "(always on with several --target)",
+    )
+    parser.add_argument(
+        "--parser",
+        choices=HTML_PARSERS,
+        default="html.parser",
+        help="BeautifulSoup parser backend (default: html.parser; "
+             "lxml is much faster if installed)",
+    )
+    parser.add_argument(
+        "--rewrite-mode",
+        choices=("serialize", "patch"),
+        default="serialize",
+        help="serialize: re-encode the parsed tree (default); patch: "
+             "change only the rewritten link bytes in the original file",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        default=None,
+        help="Stop asset discovery after this many link levels beyond "
+             "the CDX files (default: until no new assets are found)",
+    )
+    parser.add_argument(
+        "--max-assets",
+        type=int,
+        default=None,
+        help="Download at most this many discovered assets (default: no limit)",
+    )
+    parser.add_argument(
+        "--miss-cache-ttl",
+        type=float,
+        default=168.0,
+        help="Hours to skip URLs found missing from the archive (404, no "
+             "capture) by an earlier run; 0 disables (default: 168)",
+    )
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="Only list the CDX captures and report the downloads, bytes "
+             "by extension/mimetype and time the harvest would take",
+    )
+    parser.add_argument(
+        "--max-bytes",
+        type=parse_size,
+        default=None,
+        help="Download at most this much (CDX-listed sizes, e.g. 500M, 2G), "
+             "in --prefer order",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=None,
+        help="Make at most this many downloads, in --prefer order",
+    )
+    parser.add_argument(
+        "--prefer",
+        metavar="EXTS",
+        default=None,
+        help="Download order by extension under a budget, e.g. "
+             "html,css,js,png,pdf,zip (default: pages, styles, images, "
+             "documents, archives; unlisted extensions last)",
+    )
     parser.add_argument(
         "--resume",
         action="store_true",
-        help="Skip already-downloaded files",
+        help="Skip files the download journal (.harvest/journal.jsonl) "
+             "records as complete",
+    )
+    parser.add_argument(
+        "--retry-failed-only",
+        action="store_true",
+        help="Only retry the downloads the journal records as failed, then "
+             "rewrite the files that link to them (no CDX listing or asset "
+             "discovery)",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Re-harvest only captures whose CDX digest changed since the "
+             "last run (uses .harvest/state.json)",
     )
     parser.add_argument(
         "--skip-rewrite",
         action="store_true",
         help="Download only, skip link rewriting",
     )
+    parser.add_argument(
+        "--check-links",
+        action="store_true",
+        help=f"Check external links after the harvest and write {DEAD_LINK_REPORT}",
+    )
+    parser.add_argument(
+        "--mark-dead-links",
+        action="store_true",
+        help="Check external links and replace dead ones with "
+             "'text [Dead Link, url]'",
+    )
+    parser.add_argument(
+        "--check-links-only",
+        action="store_true",
+        help="Only check the external links of the HTML files already in "
+             "the output directory (no harvesting)",
+    )
+    parser.add_argument(
+        "--link-cache-ttl",
+        type=float,
+        default=168.0,
+        help="Hours to reuse cached link check results (default: 168)",
+    )
+    parser.add_argument(
+        "--warc",
+        metavar="DIR",
+        default=None,
+        help="Also record every downloaded response as gzipped WARC files "
+             "in DIR, with a CDXJ index (DIR/index.cdxj)",
+    )
+    parser.add_argument(
+        "--warc-size",
+        type=float,
+        default=WARC_MAX_SIZE / (1 << 20),
+        help="Start a new WARC file after this many MiB "
+             f"(default: {WARC_MAX_SIZE >> 20})",
+    )
+    parser.add_argument(
+        "--wacz",
+        action="store_true",
+        help="With --warc, also package the WARCs and index as DIR/<domain>.wacz",
+    )
+    parser.add_argument(
+        "--package",
+        metavar="FILE",
+        default=None,
+        help="After the harvest, write the files as a BagIt bag with "
+             "SHA-256 manifest to FILE (.zip, or .tar.zst with zstandard)",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        default=None,
+        help="Write timing events for every phase, request, sleep and "
+             "parse to FILE: JSON lines if it ends in .jsonl, otherwise "
+             "Chrome trace format (chrome://tracing, Perfetto)",
+    )
     parser.add_argument(
         "-v", "--verbose",
         action="store_true",
@@ -979,6 +4594,15 @@ def main():
     )
     args = parser.parse_args()
 
+    try:
+        targets = [
+            parse_target(spec, args.timestamp) for spec in args.target or ()
+        ] or [(args.domain, args.timestamp)]
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.jobs > 1 and len(targets) > 1:
+        parser.error("--jobs is not supported with several --target")
+
     # Default output dir: directory containing this script
     output_dir = args.output or str(Path(__file__).resolve().parent)
 
@@ -990,17 +4614,64 @@ def main():
         datefmt="%H:%M:%S",
     )
 
-    harvester = WaybackHarvester(
-        domain=args.domain,
-        timestamp=args.timestamp,
-        output_dir=output_dir,
+    options = dict(
         delay=args.delay,
         max_retries=args.max_retries,
         verbose=args.verbose,
+        workers=args.workers,
+        rate=args.rate,
+        adaptive=args.adaptive,
+        cdx_cache_ttl=args.cdx_cache_ttl * 3600,
+        cdx_cache_only=args.cdx_cache_only,
+        dedup=args.dedup,
+        parser=args.parser,
+        rewrite_mode=args.rewrite_mode,
+        trace_path=args.trace,
+        jobs=args.jobs,
+        link_cache_ttl=args.link_cache_ttl * 3600,
+        warc_dir=args.warc,
+        warc_max_size=int(args.warc_size * (1 << 20)),
+        wacz=args.wacz,
+        max_depth=args.max_depth,
+        max_assets=args.max_assets,
+        miss_cache_ttl=args.miss_cache_ttl * 3600,
+        max_bytes=args.max_bytes,
+        max_requests=args.max_requests,
+        prefer=[
+            "." + ext.strip().lstrip(".").lower()
+            for ext in args.prefer.split(",") if ext.strip()
+        ] if args.prefer else None,
     )
+    try:
+        if len(targets) > 1:
+            harvester = HarvestScheduler(targets, output_dir, **options)
+        else:
+            (domain, timestamp), = targets
+            harvester = WaybackHarvester(
+                domain=domain, timestamp=timestamp, output_dir=output_dir, **options
+            )
+    except ValueError as exc:
+        parser.error(str(exc))
+    if args.retry_failed_only:
+        harvester.retry_failed(skip_rewrite=args.skip_rewrite)
+        return
+    if args.check_links_only and len(targets) > 1:
+        harvester.check_external_links(mark=args.mark_dead_links)
+        return
+    if args.check_links_only:
+        harvester.check_external_links(
+            mark=args.mark_dead_links, pages=harvester.archive_html_pages()
+        )
+        harvester.metrics.close()
+        return
     harvester.run(
         skip_rewrite=args.skip_rewrite,
         resume=args.resume,
+        incremental=args.incremental,
+        check_links=args.check_links,
+        mark_dead_links=args.mark_dead_links,
+        package=args.package,
+        plan=args.plan,
     )
 
 